@@ -7,10 +7,26 @@
 # Due October 10, 2025
 
 from fsa import *
+from metrics import METRICS
+from search import Searcher
+from cache import Compile_Cache, regex_key, file_key
+from disk_dfa import Disk_DFA
+from parallel_dfa import parallel_determinize
+from matcher import Reverse_Matcher
+from planner import Planner
+from statistics import median
+from time import perf_counter
+import contextlib
+import cProfile
+import io
 import os
+import pstats
 import readline
 
 PROMPT = "> "
+PROFILE_TOP = 15
+# commands that work on a disk-backed DFA
+DISK_DFA_COMMANDS = ("t", "test", "b", "batch", "dfa")
 ACCEPT_REJECT = {True: "accept", False: "reject"}
 HELP_TEXT = '''
 This program simulates the operation of finite state automata (FSA).
@@ -22,9 +38,13 @@ help: display information on using the program.
 quit: end the program.
 load file <FILENAME>: load a FSA from a state transition graph file.
 load regex <REGEX>: load a FSA from a regex expression.
+load words <FILENAME>: load the minimal DFA accepting the words in a file,
+    one per line
 test [options] <STRING>: check if FSA accepts string. if -b option given
-    test using backtracking method
-batch <FILENAME>: test all strings in file
+    test using backtracking method. if -r option given, read the string
+    right to left with the DFA of the reversed FSA. Otherwise, unless
+    tracing, the test engine is chosen from the size of the automaton
+batch <FILENAME>: test all strings in file with the chosen test engine
 trace: toggle tracing. When activated, display a list of states visited
     when testing strings.
 print: print a text description of the FSA's transition graph.
@@ -32,10 +52,24 @@ write <FILENAME>: save FSA as transition graph file
 regex: generate an equivalent regex from FSA.
 import <FILENAME>: load FSA from jflap xml file
 export <FILENAME>: save FSA as jflap xml file
-reduce: minimize number of states in a DFA
-dfa: convert NFA to DFA
-type: check if current automaton is DFA or NFA
+reduce [-b]: minimize number of states in a DFA. With -b, use Brzozowski's
+    method (reverse and determinize twice), which also works on NFAs
+dfa [-d FILENAME | -p [N]]: convert NFA to DFA. With -d, store the DFA in
+    a disk file, resuming an interrupted conversion in the same file. With
+    -p, convert in parallel using N processes (default: number of CPUs)
+type: check if current automaton is DFA or NFA, and show the test engine
 label: relabel the states of FSA
+stats [on|off|reset]: show engine counters and phase timers, or turn
+    collection on/off or clear them. Collection is off by default.
+grep <FILENAME>: print the lines of a file that contain a substring
+    accepted by the FSA
+cache [on|off|clear]: show the on-disk compilation cache, turn it on/off,
+    or remove all entries. The cache is on by default.
+time [-n N] <COMMAND>: run any command N times (default 1) and report
+    the min/median/max run time. The compilation cache is not used.
+profile [-o FILENAME] <COMMAND>: run a command under cProfile and print
+    the hottest functions, or save the profile data to a file. The
+    compilation cache is not used.
 '''
 
 def make_fsa(tg):
@@ -44,157 +78,403 @@ def make_fsa(tg):
         return DFA(tg=tg)
     return NFA(tg=tg)
 
+def load_regex(regex):
+    """Make a lambda-free NFA from a regex"""
+    nfa = NFA(regex=regex).remove_lambdas()
+    nfa.label_states()
+    return nfa
+
 def check_overwrite(filename):
     """Ask before overwriting existing file"""
     msg = "File exists: overwrite? (y/n): "
     return not os.path.isfile(filename) or input(msg).lower() in ['y', 'yes']
 
-if __name__ == "__main__":
-    print("Welcome to FSA simulator. Type 'help' for instructions.")
-    running = True
-    trace = False
-    my_fsa = None
-    while running:
-        if trace:
-            print("[trace]  ", end="")
-        words = input(PROMPT).lower().split()
-        if len(words) == 0:
-            continue
-        command = words[0]
-
-        # skip empty lines
-        if command == "":
-            continue
-        
-        if command in ("exit", "quit", "q"):
-            running = False
-        elif command in ("h", "help"):
-            print(HELP_TEXT)
-        elif command == "trace":
-            trace = not trace
-        elif command in ("i", "import"):
-            if len(words) < 2:
-                print("Error: no filename given. Usage: 'import <filename>'")
+running = True
+trace = False
+my_fsa = None
+# on-disk cache, or None if caching is off
+compile_cache = None
+# True while time and profile run commands, so that they measure the
+# work itself and not cache hits
+bypass_cache = False
+# cache key of the source my_fsa was built from, or None
+fsa_key = None
+# (automaton, Reverse_Matcher) of the last reverse test, or None
+reverse_matcher = None
+# (automaton, Planner) of the last planned test, or None
+planner = None
+
+def set_fsa(fsa, key):
+    """Replace my_fsa and its cache key. The database of a replaced
+    Disk_DFA is closed."""
+    global my_fsa, fsa_key
+    if isinstance(my_fsa, Disk_DFA) and my_fsa is not fsa:
+        my_fsa.close()
+    my_fsa, fsa_key = fsa, key
+
+def cached(key, stage, build):
+    """Get automaton for key and stage from the cache, or build it"""
+    if compile_cache is None or key is None or bypass_cache:
+        return build()
+    return compile_cache.get_or_build(key, stage, build)
+
+@contextlib.contextmanager
+def cache_bypassed():
+    """Build automata without reading or writing the cache"""
+    global bypass_cache
+    previous = bypass_cache
+    bypass_cache = True
+    try:
+        yield
+    finally:
+        bypass_cache = previous
+
+def source_key(make_key, *args):
+    """Make cache key for a source, if caching is on"""
+    if compile_cache is None:
+        return None
+    return make_key(*args)
+
+def time_command(words):
+    """Run command N times, starting from the same automaton each time"""
+    reps = 1
+    if len(words) >= 2 and words[0] == "-n":
+        if not words[1].isdigit() or int(words[1]) < 1:
+            print("Error: repetitions must be a positive integer")
+            return
+        reps = int(words[1])
+        words = words[2:]
+    if len(words) == 0:
+        print("Error: no command given. Usage: 'time [-n N] <command>'")
+        return
+
+    start_fsa, start_key = my_fsa, fsa_key
+    times = []
+    for i in range(reps):
+        set_fsa(start_fsa, start_key)
+        # only show the output of the last run
+        if i < reps - 1:
+            output = contextlib.redirect_stdout(io.StringIO())
+        else:
+            output = contextlib.nullcontext()
+        with output, cache_bypassed():
+            start = perf_counter()
+            run_command(words)
+            times.append(perf_counter() - start)
+    print(f"{reps} run(s): min {min(times):.6f}s, "
+          f"median {median(times):.6f}s, max {max(times):.6f}s")
+
+def profile_command(words):
+    """Run command under cProfile and report the hottest functions"""
+    filename = None
+    if len(words) >= 2 and words[0] == "-o":
+        filename = words[1]
+        words = words[2:]
+    if len(words) == 0:
+        print("Error: no command given. Usage: 'profile [-o filename] <command>'")
+        return
+
+    profiler = cProfile.Profile()
+    with cache_bypassed():
+        profiler.enable()
+        try:
+            run_command(words)
+        finally:
+            profiler.disable()
+    if filename:
+        profiler.dump_stats(filename)
+        print("Wrote profile data to", filename)
+    else:
+        stats = pstats.Stats(profiler)
+        stats.sort_stats(pstats.SortKey.TIME).print_stats(PROFILE_TOP)
+
+def disk_dfa_command(filename):
+    """Convert my_fsa to a DFA stored in a file, resuming any previous
+    conversion saved in the file"""
+    try:
+        disk_dfa = Disk_DFA(filename, nfa=my_fsa.reduce())
+    except FSA_Error as e:
+        print("Error:", e)
+        return
+
+    def report(expanded, discovered):
+        print(f"{expanded} states expanded, {discovered - expanded} pending")
+
+    try:
+        disk_dfa.build(progress=report)
+    except KeyboardInterrupt:
+        disk_dfa.close()
+        print(f"Interrupted. Run 'dfa -d {filename}' to resume.")
+        return
+    set_fsa(disk_dfa, None)
+    print(f"Converted automaton to a DFA with {len(disk_dfa)} states in {filename}")
+
+def get_reverse_matcher(fsa):
+    """Get a right to left matcher for fsa, reusing the last one built"""
+    global reverse_matcher
+    if reverse_matcher is None or reverse_matcher[0] is not fsa:
+        reverse_matcher = (fsa, Reverse_Matcher(fsa))
+    return reverse_matcher[1]
+
+def get_planner(fsa):
+    """Get the test engine planner for fsa, reusing the last one built"""
+    global planner
+    if planner is None or planner[0] is not fsa:
+        planner = (fsa, Planner(fsa))
+    return planner[1]
+
+def run_command(words):
+    """Run one command given as a list of lowercase words"""
+    global running, trace, compile_cache, fsa_key
+    command = words[0]
+
+    if command in ("exit", "quit", "q"):
+        set_fsa(None, None)
+        running = False
+    elif command in ("h", "help"):
+        print(HELP_TEXT)
+    elif command == "trace":
+        trace = not trace
+    elif command in ("i", "import"):
+        if len(words) < 2:
+            print("Error: no filename given. Usage: 'import <filename>'")
+        else:
+            filename = words[1]
+            if os.path.isfile(filename):
+                try:
+                    key = source_key(file_key, filename, "jflap")
+                    build = lambda: make_fsa(Transition_Graph(jflap=filename))
+                    set_fsa(cached(key, "fsa", build), key)
+                    print("Imported jflap xml file")
+                except FSA_Error as e:
+                    print("File is not a valid FSA:", e)
+                except Exception as e:
+                    print("Invalid file format:", e)
             else:
+                print("Error: cannot open", filename)        
+    elif command in ("l", "load"):
+        if len(words) < 2:
+            print("Error: Load requires at least 2 arguments")
+        else:
+            filename = None
+            if len(words) == 2:
                 filename = words[1]
+            elif words[1] in ("-f", "file"):
+                filename=words[2]
+            if filename:
                 if os.path.isfile(filename):
                     try:
-                        tg = Transition_Graph(jflap=words[1])
-                        my_fsa = make_fsa(tg)
-                        print("Imported jflap xml file")
+                        key = source_key(file_key, filename, "file")
+                        build = lambda: make_fsa(Transition_Graph(filename=filename))
+                        set_fsa(cached(key, "fsa", build), key)
+                        print("file loaded")
                     except FSA_Error as e:
-                        print("File is not a valid FSA:", e)
-                    except Exception as e:
-                        print("Invalid file format:", e)
+                        print("Invalid file:", e)
                 else:
-                    print("Error: cannot open", filename)        
-        elif command in ("l", "load"):
-            if len(words) < 2:
-                print("Error: Load requires at least 2 arguments")
-            else:
-                filename = None
-                if len(words) == 2:
-                    filename = words[1]
-                elif words[1] in ("-f", "file"):
-                    filename=words[2]
-                if filename:
-                    if os.path.isfile(filename):
-                        try:
-                            tg = Transition_Graph(filename=filename)
-                            my_fsa = make_fsa(tg)
-                            print("file loaded")
-                        except FSA_Error as e:
-                            print("Invalid file:", e)
-                    else:
-                        print("Error: cannot open", filename)
-                elif words[1] in ("-r", "regex"):
-                    my_fsa = NFA(regex=words[2])
-                    print("regex loaded")           
+                    print("Error: cannot open", filename)
+            elif words[1] in ("-w", "words"):
+                filename = words[2]
+                if os.path.isfile(filename):
+                    try:
+                        key = source_key(file_key, filename, "words")
+                        build = lambda: DFA(words=read_words(filename))
+                        set_fsa(cached(key, "fsa", build), key)
+                        print("word list loaded")
+                    except FSA_Error as e:
+                        print("Invalid word list:", e)
                 else:
-                    print("Error: unrecognized load option. Use 'file' or 'regex'.")
-
-        elif command == "type":
-            if isinstance(my_fsa, DFA):
-                print("DFA")
-            elif isinstance(my_fsa, NFA):
-                print("NFA")
+                    print("Error: cannot open", filename)
+            elif words[1] in ("-r", "regex"):
+                key = source_key(regex_key, words[2], ("lambda_free",))
+                set_fsa(cached(key, "nfa", lambda: load_regex(words[2])), key)
+                print("regex loaded")           
             else:
-                print("No automaton loaded")
+                print("Error: unrecognized load option. Use 'file', 'regex' or 'words'.")
 
-        # Commands after this point require a FSA to be loaded
+    elif command == "cache":
+        option = words[1] if len(words) > 1 else None
+        if option == "on":
+            if compile_cache is None:
+                compile_cache = Compile_Cache()
+            print("Compilation cache on")
+        elif option == "off":
+            compile_cache = None
+            fsa_key = None
+            print("Compilation cache off")
+        elif compile_cache is None:
+            print("Compilation cache is off")
+        elif option == "clear":
+            compile_cache.clear()
+            print("Compilation cache cleared")
+        elif option is None:
+            print(f"Cache directory: {compile_cache.directory}")
+            print(f"Size: {compile_cache.size()} bytes, "
+                  f"limit {compile_cache.max_bytes} bytes")
+            print(f"Hits: {compile_cache.hits}, misses: {compile_cache.misses}")
+        else:
+            print("Error: unrecognized cache option. Use 'on', 'off' or 'clear'.")
+    elif command == "time":
+        time_command(words[1:])
+    elif command == "profile":
+        profile_command(words[1:])
+    elif command == "stats":
+        option = words[1] if len(words) > 1 else None
+        if option == "on":
+            METRICS.enabled = True
+            print("Metrics collection on")
+        elif option == "off":
+            METRICS.enabled = False
+            print("Metrics collection off")
+        elif option == "reset":
+            METRICS.reset()
+            print("Metrics cleared")
+        elif option is None:
+            print(METRICS)
+        else:
+            print("Error: unrecognized stats option. Use 'on', 'off' or 'reset'.")
+    elif command == "type":
+        if isinstance(my_fsa, Disk_DFA):
+            print(f"DFA (stored in {my_fsa.path})")
+        elif isinstance(my_fsa, (DFA, NFA)):
+            print(type(my_fsa).__name__)
+            print("Test engine:", get_planner(my_fsa).describe())
+        else:
+            print("No automaton loaded")
+
+    # Commands after this point require a FSA to be loaded
+    elif my_fsa is None:
+        print("Error: no FSA loaded")
+    elif isinstance(my_fsa, Disk_DFA) and command not in DISK_DFA_COMMANDS:
+        print("Error: only test and batch can be used with a DFA stored on disk")
+    elif command in ("p", "print"):
+        print(my_fsa)
+    elif command in ("t", "test"):
+        if len(words) < 2:
+            print("Error: no string given. Usage: 'test <string>'")
+        else:
+            backtrack = False
+            reverse = False
+            test_string = words[1]
+            if len(words) >= 3 and words[1][0] == "-":
+                options = words[1][1:]
+                test_string = words[2]
+                if "b" in options:
+                    backtrack = True
+                if "r" in options:
+                    reverse = True
+            if reverse and not isinstance(my_fsa, Disk_DFA):
+                matcher = get_reverse_matcher(my_fsa)
+                matcher.reset()
+                if test_string != LAMBDA_CHAR:
+                    matcher.feed(test_string)
+                result = matcher.accepting()
+            elif isinstance(my_fsa, NFA) and backtrack:
+                result = my_fsa.test_backtrack(test_string, trace)
+            elif trace or isinstance(my_fsa, Disk_DFA):
+                result = my_fsa.test(test_string, trace)
+            else:
+                result = get_planner(my_fsa).test(test_string)
+            print(ACCEPT_REJECT[result])
+    elif command == "regex":
+        print(my_fsa.to_regex())
+    elif command == "label":
+        my_fsa.label_states()
+    elif command in ("w", "write"):
+        if len(words) < 2:
+            print("Error: no filename given. Usage: 'write <filename>'")
         elif my_fsa is None:
             print("Error: no FSA loaded")
-        elif command in ("p", "print"):
-            print(my_fsa)
-        elif command in ("t", "test"):
-            if len(words) < 2:
-                print("Error: no string given. Usage: 'test <string>'")
-            else:
-                backtrack = False
-                test_string = words[1]
-                if len(words) >= 3 and words[1][0] == "-":
-                    options = words[1][1:]
-                    test_string = words[2]
-                    if "b" in options:
-                        backtrack = True
-                if isinstance(my_fsa, NFA) and backtrack:
-                    result = my_fsa.test_backtrack(test_string, trace)
-                else:
-                    result = my_fsa.test(test_string, trace)
-                print(ACCEPT_REJECT[result])
-        elif command == "regex":
-            print(my_fsa.to_regex())
-        elif command == "label":
-            my_fsa.label_states()
-        elif command in ("w", "write"):
-            if len(words) < 2:
-                print("Error: no filename given. Usage: 'write <filename>'")
-            elif my_fsa is None:
-                print("Error: no FSA loaded")
+        else:
+            filename = words[1]
+            ok_to_write = check_overwrite(filename)
+            if ok_to_write:
+                my_fsa.write_file(filename)
+                print("Wrote transition graph to", filename)
             else:
-                filename = words[1]
-                ok_to_write = check_overwrite(filename)
-                if ok_to_write:
-                    my_fsa.write_file(filename)
-                    print("Wrote transition graph to", filename)
-                else:
-                    print("Write canceled")
-        elif command == "reduce":
-            if isinstance(my_fsa, DFA):
-                num_state_before = len(my_fsa.get_state_list())
-                DFA_reduced = my_fsa.reduce()
-                num_state_after = len(DFA_reduced.get_state_list())
-                reduction = num_state_before - num_state_after
-                if reduction == 0:
-                    print("DFA is already minimal")
-                else:
-                    my_fsa = DFA_reduced
-                    print(f"Reduced number of states by {reduction}.")
+                print("Write canceled")
+    elif command == "reduce":
+        brzozowski = len(words) >= 2 and words[1] in ("-b", "brzozowski")
+        if isinstance(my_fsa, NFA) and brzozowski:
+            set_fsa(cached(fsa_key, "min_dfa", my_fsa.brzozowski), fsa_key)
+            print(f"Converted automaton to a minimal DFA with "
+                  f"{len(my_fsa.get_state_list())} states")
+        elif isinstance(my_fsa, DFA):
+            num_state_before = len(my_fsa.get_state_list())
+            reduce = my_fsa.brzozowski if brzozowski else my_fsa.reduce
+            DFA_reduced = cached(fsa_key, "min_dfa", reduce)
+            num_state_after = len(DFA_reduced.get_state_list())
+            reduction = num_state_before - num_state_after
+            if reduction == 0:
+                print("DFA is already minimal")
             else:
-                print("Error: automaton is not a DFA. Use command <dfa> first.")
-        elif command == "dfa":
-            if isinstance(my_fsa, DFA):
-                print("Automaton is already a DFA")
+                set_fsa(DFA_reduced, fsa_key)
+                print(f"Reduced number of states by {reduction}.")
+        else:
+            print("Error: automaton is not a DFA. Use command <dfa> first.")
+    elif command == "dfa":
+        if isinstance(my_fsa, (DFA, Disk_DFA)):
+            print("Automaton is already a DFA")
+        elif len(words) >= 3 and words[1] in ("-d", "disk"):
+            disk_dfa_command(words[2])
+        elif len(words) >= 2 and words[1] in ("-p", "parallel"):
+            if len(words) >= 3 and (not words[2].isdigit() or int(words[2]) < 1):
+                print("Error: number of processes must be a positive integer")
             else:
-                my_fsa = DFA(nfa=my_fsa)
+                workers = int(words[2]) if len(words) >= 3 else None
+                build = lambda: parallel_determinize(my_fsa.reduce(), workers)
+                set_fsa(cached(fsa_key, "dfa", build), fsa_key)
                 print("Converted automaton to a DFA")
-        elif command in ("e", "export"):
-            if len(words) < 2:
-                print("Error: no filename given. Usage: 'export <filename>'")
-            else:
-                my_fsa.write_jflap(words[1])
-                print("Wrote JFLAP xml to", words[1])
-        elif command in ("b", "batch"):
-            if len(words) < 2:
-                print("Error: no file name given")
-            else:
-                with open(words[1]) as file:
-                    lines = file.readlines()
-                for line in lines:
-                    line = line.strip()
-                    if line == "":
-                        line = LAMBDA_CHAR
-                    print (f"{line:.<15}{ACCEPT_REJECT[my_fsa.test(line)]}")
-
         else:
-            print(f"Unrecognized command: {command}")
\ No newline at end of file
+            set_fsa(cached(fsa_key, "dfa", lambda: DFA(nfa=my_fsa.reduce())), fsa_key)
+            print("Converted automaton to a DFA")
+    elif command in ("e", "export"):
+        if len(words) < 2:
+            print("Error: no filename given. Usage: 'export <filename>'")
+        else:
+            my_fsa.write_jflap(words[1])
+            print("Wrote JFLAP xml to", words[1])
+    elif command in ("b", "batch"):
+        if len(words) < 2:
+            print("Error: no file name given")
+        else:
+            with open(words[1]) as file:
+                lines = file.readlines()
+            fsa = my_fsa if isinstance(my_fsa, Disk_DFA) else get_planner(my_fsa)
+            for line in lines:
+                line = line.strip()
+                if line == "":
+                    line = LAMBDA_CHAR
+                print (f"{line:.<15}{ACCEPT_REJECT[fsa.test(line)]}")
+    elif command == "grep":
+        if len(words) < 2:
+            print("Error: no filename given. Usage: 'grep <filename>'")
+        elif not os.path.isfile(words[1]):
+            print("Error: cannot open", words[1])
+        else:
+            num_matches = 0
+            for number, line in Searcher(my_fsa).grep(words[1]):
+                print(f"{number}:{line}")
+                num_matches += 1
+            print(f"{num_matches} matching line(s)")
+
+    else:
+        print(f"Unrecognized command: {command}")
+
+
+if __name__ == "__main__":
+    print("Welcome to FSA simulator. Type 'help' for instructions.")
+    try:
+        compile_cache = Compile_Cache()
+    except OSError as e:
+        print("Compilation cache disabled:", e)
+    try:
+        while running:
+            if trace:
+                print("[trace]  ", end="")
+            words = input(PROMPT).lower().split()
+            # skip empty lines
+            if len(words) == 0:
+                continue
+            run_command(words)
+    finally:
+        set_fsa(None, None)
\ No newline at end of file
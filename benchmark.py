@@ -0,0 +1,231 @@
+#! /usr/bin/python3
+
+"""Benchmark suite for the regex -> NFA -> DFA pipeline.
+
+Times each pipeline stage on parameterized synthetic regex families and
+writes the results as JSON. Results can be compared against a stored
+baseline to catch performance regressions between versions.
+
+Usage:
+    python3 benchmark.py [--quick] [--output FILE] [--baseline FILE]
+                         [--threshold FRACTION] [--family NAME ...]
+"""
+
+import argparse
+import json
+import platform
+import random
+import string
+import sys
+import time
+import regex
+from fsa import NFA, DFA
+from testing.make_regex import make_regex
+
+FORMAT_VERSION = 1
+DEFAULT_REPEAT = 3
+DEFAULT_THRESHOLD = 0.25
+# stages faster than this are not compared, since timer noise and
+# scheduling make their relative changes meaningless
+DEFAULT_MIN_TIME = 0.001
+NUM_TEST_STRINGS = 200
+TEST_STRING_LENGTH = 20
+
+# stages in pipeline order; all values are seconds, lower is better
+STAGES = ("parse", "nfa", "dfa", "reduce", "to_regex",
+          "test_nfa", "test_backtrack", "test_dfa")
+
+# nested stars make backtracking exponential in the nesting depth; at
+# depth 4 one repeat already takes about 12 seconds
+MAX_BACKTRACK_DEPTH = 3
+
+def blowup_family(sizes):
+    """(a|b)*a(a|b)^n: the minimal DFA has 2^(n+1) states"""
+    return [(f"blowup/n={n}", "(a|b)*a" + "(a|b)" * n, ()) for n in sizes]
+
+def nested_star_family(depths):
+    """Stars nested to the given depth, e.g. ((a*b)*a)*"""
+    cases = []
+    for depth in depths:
+        expr = "a"
+        for i in range(depth):
+            expr = f"({expr}*{'ab'[(i + 1) % 2]})"
+        skip = ("test_backtrack",) if depth > MAX_BACKTRACK_DEPTH else ()
+        cases.append((f"nested_star/depth={depth}", expr + "*", skip))
+    return cases
+
+def literal_union_family(sizes, word_len=5, seed=0):
+    """Union of random literal words over a-z"""
+    rng = random.Random(seed)
+    cases = []
+    for n in sizes:
+        words = ["".join(rng.choice(string.ascii_lowercase)
+                         for _ in range(word_len)) for _ in range(n)]
+        cases.append((f"literal_union/n={n}", "|".join(words), ()))
+    return cases
+
+def random_family(count, num_letters=3, seed=0):
+    """Random regexes from testing/make_regex.py"""
+    rng = random.Random(seed)
+    exprs = rng.sample(make_regex(num_letters), count)
+    return [(f"random/{i}", expr, ()) for i, expr in enumerate(exprs)]
+
+def make_families(quick=False):
+    if quick:
+        return {
+            "blowup": blowup_family([2, 4]),
+            "nested_star": nested_star_family([2, 4]),
+            "literal_union": literal_union_family([10, 50]),
+            "random": random_family(5),
+        }
+    return {
+        "blowup": blowup_family([2, 4, 6, 8, 10]),
+        "nested_star": nested_star_family([2, 3, 4, 8, 16]),
+        "literal_union": literal_union_family([10, 50, 200]),
+        "random": random_family(20),
+    }
+
+def best_time(func, repeat):
+    """Run func repeat times; return (min elapsed seconds, last result)"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+def make_test_strings(dfa, seed=0):
+    """Mix of accepted and rejected strings drawn from the DFA"""
+    half = NUM_TEST_STRINGS // 2
+    strings = dfa.sample(TEST_STRING_LENGTH, half, seed)
+    strings += dfa.sample_rejected(TEST_STRING_LENGTH, half, seed)
+    return strings
+
+def run_case(expr, repeat, skip=()):
+    """Time every pipeline stage for one regex. Skipped or failed stages
+    are recorded with a time of None."""
+    times = {}
+    errors = {}
+
+    def run_stage(stage, func):
+        if stage in skip:
+            times[stage] = None
+            return None
+        try:
+            times[stage], result = best_time(func, repeat)
+        except RecursionError as e:
+            times[stage] = None
+            errors[stage] = repr(e)
+            result = None
+        return result
+
+    tree = run_stage("parse", lambda: regex.parse(expr))
+    nfa = tree and run_stage("nfa", lambda: NFA(node=tree))
+    dfa = nfa and run_stage("dfa", lambda: DFA(nfa=nfa))
+    min_dfa = dfa and run_stage("reduce", dfa.reduce)
+    if min_dfa is None:
+        # a stage the rest of the pipeline depends on failed
+        for stage in STAGES:
+            times.setdefault(stage, None)
+        return {"regex": expr, "times": times, "sizes": {}, "errors": errors}
+    # to_regex works on scratch data in the states, so each run gets an
+    # NFA of its own, built outside the timed call
+    nfas = [NFA(node=tree) for _ in range(repeat)]
+    run_stage("to_regex", lambda: nfas.pop().to_regex())
+
+    strings = make_test_strings(min_dfa)
+    test_funcs = {"test_nfa": nfa.test, "test_backtrack": nfa.test_backtrack,
+                  "test_dfa": min_dfa.test}
+    for stage, test in test_funcs.items():
+        run_stage(stage, lambda: [test(s) for s in strings])
+
+    sizes = {"nfa_states": len(nfa.get_state_list()),
+             "dfa_states": len(dfa.get_state_list()),
+             "min_dfa_states": len(min_dfa.get_state_list()),
+             "test_strings": len(strings)}
+    return {"regex": expr, "times": times, "sizes": sizes, "errors": errors}
+
+def run_benchmarks(families, repeat=DEFAULT_REPEAT, verbose=True):
+    """Run all cases in families and return JSON-serializable results"""
+    results = {}
+    for cases in families.values():
+        for name, expr, skip in cases:
+            if verbose:
+                print(f"{name:30}", end="", file=sys.stderr, flush=True)
+            results[name] = run_case(expr, repeat, skip)
+            if verbose:
+                total = sum(filter(None, results[name]["times"].values()))
+                print(f"{total:10.4f}s", file=sys.stderr)
+    return {
+        "version": FORMAT_VERSION,
+        "python": platform.python_version(),
+        "repeat": repeat,
+        "results": results,
+    }
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD,
+            min_time=DEFAULT_MIN_TIME):
+    """Get list of (case, stage, old, new) where new is slower than old
+    by more than threshold (a fraction of the old time). Stages that now
+    take less than min_time seconds are ignored."""
+    regressions = []
+    for name, case in results["results"].items():
+        old_case = baseline["results"].get(name)
+        if old_case is None:
+            continue
+        for stage, new_time in case["times"].items():
+            old_time = old_case["times"].get(stage)
+            if not (old_time and new_time) or new_time < min_time:
+                continue
+            if new_time > old_time * (1 + threshold):
+                regressions.append((name, stage, old_time, new_time))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the FSA pipeline")
+    parser.add_argument("--quick", action="store_true",
+                        help="run small instances of each family")
+    parser.add_argument("--family", action="append",
+                        help="only run the named family (repeatable)")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT,
+                        help="runs per stage; the fastest is reported")
+    parser.add_argument("--output", help="write JSON results to file")
+    parser.add_argument("--baseline", help="compare against JSON results file")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="allowed slowdown fraction before failing")
+    parser.add_argument("--min-time", type=float, default=DEFAULT_MIN_TIME,
+                        help="ignore stages faster than this many seconds")
+    args = parser.parse_args(argv)
+
+    families = make_families(args.quick)
+    if args.family:
+        unknown = set(args.family) - set(families)
+        if unknown:
+            parser.error(f"unknown family: {', '.join(sorted(unknown))}")
+        families = {f: families[f] for f in args.family}
+
+    results = run_benchmarks(families, args.repeat)
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(text + "\n")
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline, args.threshold, args.min_time)
+        for name, stage, old_time, new_time in regressions:
+            print(f"REGRESSION {name} {stage}: {old_time:.6f}s -> "
+                  f"{new_time:.6f}s ({new_time / old_time:.2f}x)",
+                  file=sys.stderr)
+        if regressions:
+            return 1
+        print("No regressions against baseline", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
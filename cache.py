@@ -0,0 +1,177 @@
+#! /usr/bin/python3
+
+"""Persistent on-disk cache of constructed automata.
+
+Entries are addressed by a hash of their source (regex text, or file
+contents and modification time), the pipeline options and the pipeline
+stage ("nfa", "dfa", "min_dfa", ...). Automata are stored as zlib
+compressed JSON, so loading an entry never runs code from the cache.
+Writes go through a temporary file and an atomic rename, so concurrent
+processes never see partial entries. The least recently used entries
+are removed when the cache grows past its size limit.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import zlib
+from fsa import NFA, NFA_State, DFA, DFA_State
+
+FORMAT_VERSION = 1
+# part of every key; increase it when a stage is built differently, so
+# entries made by older versions are not used. Version 2: the dfa stage
+# reduces the NFA before determinizing it.
+PIPELINE_VERSION = 2
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+CACHE_DIR_ENV = "FSA_CACHE_DIR"
+ENTRY_SUFFIX = ".fsa"
+
+def serialize(fsa):
+    """Encode an NFA or DFA as compressed bytes"""
+    states = fsa.get_state_list()
+    index = {state: i for i, state in enumerate(states)}
+    transitions = [{char: [index[dest] for dest in dest_states]
+                    for char, dest_states in state.get_transitions().items()
+                    if dest_states} for state in states]
+    data = {
+        "version": FORMAT_VERSION,
+        "type": "dfa" if isinstance(fsa, DFA) else "nfa",
+        "labels": [state.label for state in states],
+        "init": index[fsa.init_state],
+        "final": sorted(index[s] for s in fsa.final_states if s in index),
+        "transitions": transitions,
+    }
+    text = json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+    return zlib.compress(text.encode("utf-8"))
+
+def deserialize(blob):
+    """Decode bytes made by serialize into a new NFA or DFA"""
+    data = json.loads(zlib.decompress(blob).decode("utf-8"))
+    if data["version"] != FORMAT_VERSION:
+        raise ValueError("unsupported cache format version")
+    if data["type"] == "dfa":
+        fsa, state_class = DFA(), DFA_State
+    else:
+        fsa, state_class = NFA(), NFA_State
+    states = [state_class(label) for label in data["labels"]]
+    for state, transitions in zip(states, data["transitions"]):
+        for char, dests in transitions.items():
+            for dest in dests:
+                state.add_transition(char, states[dest])
+    fsa.init_state = states[data["init"]]
+    fsa.final_states = {states[i] for i in data["final"]}
+    return fsa
+
+def make_key(*parts):
+    """Hash a sequence of key parts"""
+    digest = hashlib.sha256()
+    for part in (FORMAT_VERSION, PIPELINE_VERSION) + parts:
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+def regex_key(regex, options=()):
+    """Key for an automaton built from a regex"""
+    return make_key("regex", regex, *options)
+
+def file_key(filename, loader="file", options=()):
+    """Key for an automaton loaded from a file"""
+    with open(filename, "rb") as file:
+        content_hash = hashlib.sha256(file.read()).hexdigest()
+    mtime = os.stat(filename).st_mtime_ns
+    return make_key(loader, content_hash, mtime, *options)
+
+def default_cache_dir():
+    if os.environ.get(CACHE_DIR_ENV):
+        return os.environ[CACHE_DIR_ENV]
+    return os.path.join(os.path.expanduser("~"), ".cache", "fsa")
+
+class Compile_Cache:
+    """Size-bounded LRU cache of automata stored in a directory"""
+    def __init__(self, directory=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory or default_cache_dir()
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key, stage):
+        return os.path.join(self.directory, f"{key}-{stage}{ENTRY_SUFFIX}")
+
+    def get(self, key, stage):
+        """Get the cached automaton for key and stage, or None"""
+        path = self._path(key, stage)
+        try:
+            with open(path, "rb") as file:
+                fsa = deserialize(file.read())
+            # the modification time records the last use for eviction
+            os.utime(path)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except (ValueError, KeyError, TypeError, zlib.error):
+            # corrupt or outdated entry
+            self._remove(path)
+            self.misses += 1
+            return None
+        self.hits += 1
+        return fsa
+
+    def put(self, key, stage, fsa):
+        """Store an automaton, then evict old entries if over the size limit"""
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                file.write(serialize(fsa))
+            os.replace(tmp_path, self._path(key, stage))
+        except BaseException:
+            self._remove(tmp_path)
+            raise
+        self.evict()
+
+    def get_or_build(self, key, stage, build):
+        """Get the cached automaton, or call build() and cache its result"""
+        fsa = self.get(key, stage)
+        if fsa is None:
+            fsa = build()
+            self.put(key, stage, fsa)
+        return fsa
+
+    def _entries(self):
+        """Get list of (last use time, size, path) of all entries"""
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(ENTRY_SUFFIX):
+                path = os.path.join(self.directory, name)
+                try:
+                    info = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((info.st_mtime_ns, info.st_size, path))
+        return entries
+
+    def evict(self):
+        """Remove least recently used entries until under the size limit"""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    def clear(self):
+        for _, _, path in self._entries():
+            self._remove(path)
+
+    def size(self):
+        """Get total size in bytes of all entries"""
+        return sum(size for _, size, _ in self._entries())
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
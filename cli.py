@@ -0,0 +1,212 @@
+#! /usr/bin/python3
+
+"""Non-interactive command line interface for scripts and pipelines.
+
+Commands are chained on the command line, or read one per line from a
+script file ("-" for standard input). Each command prints one JSON
+object per line of output. A load command starts a new automaton, so one
+script can run many jobs in a single process.
+
+    load regex <REGEX> | load file <FILENAME> | load jflap <FILENAME>
+    load words <FILENAME>
+    dfa | reduce | type | regex
+    test [-b] <STRING>
+    batch <FILENAME>
+    write <FILENAME> | export <FILENAME>
+
+Exit status is 0 if every tested string was accepted, 1 if any was
+rejected and 2 on an error. Processing stops at the first error.
+
+Usage:
+    python3 cli.py load regex "(a|b)*abb" dfa reduce test abb test ab
+    python3 cli.py --script jobs.txt
+"""
+
+import argparse
+import itertools
+import json
+import shlex
+import sys
+import memo
+from fsa import NFA, DFA, Transition_Graph, FSA_Error, LAMBDA_CHAR, read_words
+from planner import Planner
+
+# number of arguments taken by each command, not counting options
+ARITY = {"load": 2, "dfa": 0, "reduce": 0, "type": 0, "regex": 0,
+         "test": 1, "batch": 1, "write": 1, "export": 1}
+EXIT_OK = 0
+EXIT_REJECTED = 1
+EXIT_ERROR = 2
+
+class CLI_Error(Exception):
+    pass
+
+def split_chain(tokens):
+    """Split a list of tokens into a list of commands"""
+    commands = []
+    i = 0
+    while i < len(tokens):
+        command = tokens[i]
+        if command not in ARITY:
+            raise CLI_Error(f"unrecognized command {command!r}")
+        end = i + 1 + ARITY[command]
+        if command == "test" and tokens[i + 1:i + 2] == ["-b"]:
+            end += 1
+        if end > len(tokens):
+            raise CLI_Error(f"{command} needs {ARITY[command]} argument(s)")
+        commands.append(tokens[i:end])
+        i = end
+    return commands
+
+def read_script(filename):
+    """Read commands from a script file, one per line"""
+    file = sys.stdin if filename == "-" else open(filename)
+    with file:
+        for line in file:
+            words = shlex.split(line, comments=True)
+            if words:
+                yield from split_chain(words)
+
+class Session:
+    """Current automaton and the commands that act on it. Commands are
+    run by the do_<command> methods."""
+    def __init__(self):
+        self.fsa = None
+        # regex the automaton was compiled from, or None. Compiled regexes
+        # come from the shared memo, so repeated jobs are not rebuilt.
+        self.source_regex = None
+        # Planner for the automaton, built by the first test
+        self.planner = None
+        self.rejected = False
+
+    def run(self, words):
+        """Run one command, yielding JSON-ready result dicts"""
+        command, args = words[0], words[1:]
+        if command == "load":
+            yield self.do_load(*args)
+        elif self.fsa is None:
+            raise CLI_Error("no automaton loaded")
+        elif command == "test":
+            yield self.do_test(args[-1], backtrack=args[0] == "-b")
+        elif command == "batch":
+            with open(args[0]) as file:
+                for line in file:
+                    yield self.do_test(line.strip())
+        else:
+            yield getattr(self, "do_" + command)(*args)
+
+    def do_load(self, source, arg):
+        if source == "regex":
+            self.fsa = memo.compile_regex(arg, "nfa")
+            self.source_regex = arg
+        elif source in ("file", "jflap"):
+            if source == "file":
+                tg = Transition_Graph(filename=arg)
+            else:
+                tg = Transition_Graph(jflap=arg)
+            self.fsa = DFA(tg=tg) if tg.is_dfa() else NFA(tg=tg)
+            self.source_regex = None
+        elif source == "words":
+            self.fsa = DFA(words=read_words(arg))
+            self.source_regex = None
+        else:
+            raise CLI_Error(f"unrecognized load source {source!r}")
+        return self.describe("load")
+
+    def do_dfa(self):
+        if not isinstance(self.fsa, DFA):
+            if self.source_regex is not None:
+                self.fsa = memo.compile_regex(self.source_regex, "dfa")
+            else:
+                self.fsa = DFA(nfa=self.fsa.reduce())
+        return self.describe("dfa")
+
+    def do_reduce(self):
+        if not isinstance(self.fsa, DFA):
+            raise CLI_Error("automaton is not a DFA; use dfa first")
+        states_before = len(self.fsa.get_state_list())
+        if self.source_regex is not None:
+            self.fsa = memo.compile_regex(self.source_regex, "min_dfa")
+        else:
+            self.fsa = self.fsa.reduce()
+        result = self.describe("reduce")
+        result["states_before"] = states_before
+        return result
+
+    def do_type(self):
+        result = self.describe("type")
+        planner = self.get_planner()
+        result["engine"], result["reason"] = planner.engine, planner.reason
+        return result
+
+    def do_regex(self):
+        return {"command": "regex", "regex": str(self.fsa.to_regex())}
+
+    def do_test(self, s, backtrack=False):
+        s = s or LAMBDA_CHAR
+        if backtrack and isinstance(self.fsa, NFA):
+            accepted, engine = self.fsa.test_backtrack(s), "backtrack"
+        else:
+            planner = self.get_planner()
+            accepted, engine = planner.test(s), planner.engine
+        self.rejected |= not accepted
+        return {"command": "test", "string": s, "accepted": accepted,
+                "engine": engine}
+
+    def get_planner(self):
+        if self.planner is None or self.planner.fsa is not self.fsa:
+            self.planner = Planner(self.fsa)
+        return self.planner
+
+    def do_write(self, filename):
+        self.labeled_copy().write_file(filename)
+        return {"command": "write", "file": filename}
+
+    def do_export(self, filename):
+        self.labeled_copy().write_jflap(filename)
+        return {"command": "export", "file": filename}
+
+    def labeled_copy(self):
+        """Get a copy of the automaton with numbered states. Labels made by
+        dfa are sets of NFA states, which cannot be read back from a file,
+        and the automaton may be shared through the memo."""
+        fsa = self.fsa.copy()
+        fsa.label_states()
+        return fsa
+
+    def describe(self, command):
+        return {"command": command, "type": type(self.fsa).__name__,
+                "states": len(self.fsa.get_state_list())}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Run FSA commands non-interactively with JSON output")
+    parser.add_argument("--script", help="read commands from file ('-' for stdin)")
+    parser.add_argument("commands", nargs=argparse.REMAINDER,
+                        help="chain of commands to run")
+    args = parser.parse_args(argv)
+
+    session = Session()
+    command = None
+    try:
+        commands = split_chain(args.commands)
+        if args.script:
+            commands = itertools.chain(commands, read_script(args.script))
+        for words in commands:
+            command = words[0]
+            for result in session.run(words):
+                print(json.dumps(result, ensure_ascii=False))
+    except (CLI_Error, FSA_Error, SyntaxError, OSError) as e:
+        print(json.dumps({"command": command, "error": str(e)}))
+        return EXIT_ERROR
+    except Exception as e:
+        # anything else, such as a script line with an unclosed quote or
+        # a graph with an undefined label, must not exit with the status
+        # of a rejected string
+        error = f"{type(e).__name__}: {e}"
+        print(json.dumps({"command": command, "error": error}))
+        return EXIT_ERROR
+    return EXIT_REJECTED if session.rejected else EXIT_OK
+
+if __name__ == "__main__":
+    sys.exit(main())
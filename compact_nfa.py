@@ -0,0 +1,188 @@
+#! /usr/bin/python3
+
+"""Frozen array-backed NFA for matching and determinization"""
+
+import json
+import zlib
+from array import array
+from bisect import bisect_left, bisect_right
+from fsa import (NFA, NFA_State, DFA, DFA_State, Symbol_Map, LAMBDA_CHAR,
+                 atomize, first_char)
+
+# array typecode for state and symbol numbers
+INDEX_TYPE = "i"
+ARRAY_FIELDS = ("offsets", "edge_symbols", "edge_targets",
+                "lambda_offsets", "lambda_targets")
+
+def subset_label(subset):
+    """Label for a DFA state made from a set of state numbers"""
+    return "{" + ", ".join(str(i) for i in sorted(subset)) + "}"
+
+class Compact_NFA:
+    """Immutable NFA with states numbered 0..n-1.
+
+    Transitions are stored in compressed sparse row (CSR) form. The edges
+    leaving state i are edge_symbols/edge_targets[offsets[i]:offsets[i + 1]],
+    sorted by symbol number, so the targets on one symbol are found by
+    binary search. Lambda edges have their own CSR arrays, and final
+    states are kept in a bitmap. Memory is a few bytes per state and
+    edge, instead of several dicts and sets per state. Character class
+    labels are split into disjoint atoms, which are the symbols."""
+
+    __slots__ = ("num_states", "init_state", "symbols", "symbol_ids",
+                 "offsets", "edge_symbols", "edge_targets",
+                 "lambda_offsets", "lambda_targets", "accept")
+
+    def __init__(self, nfa):
+        states = nfa.get_state_list()
+        index = {state: i for i, state in enumerate(states)}
+        self.num_states = len(states)
+        self.init_state = index[nfa.init_state]
+        atoms = atomize(nfa.get_alphabet())
+        self.symbols = sorted({atom for label_atoms in atoms.values()
+                               for atom in label_atoms}, key=first_char)
+        atom_ids = {atom: i for i, atom in enumerate(self.symbols)}
+        self.symbol_ids = Symbol_Map([[atom] for atom in self.symbols])
+        self.offsets = array(INDEX_TYPE, [0])
+        self.edge_symbols = array(INDEX_TYPE)
+        self.edge_targets = array(INDEX_TYPE)
+        self.lambda_offsets = array(INDEX_TYPE, [0])
+        self.lambda_targets = array(INDEX_TYPE)
+        self.accept = bytearray((self.num_states + 7) // 8)
+
+        for i, state in enumerate(states):
+            edges = sorted((atom_ids[atom], index[dest])
+                           for char, dests in state.outgoing.items()
+                           if char != LAMBDA_CHAR for dest in dests
+                           for atom in atoms[char])
+            for symbol, dest in edges:
+                self.edge_symbols.append(symbol)
+                self.edge_targets.append(dest)
+            self.offsets.append(len(self.edge_targets))
+            for dest in state.outgoing.get(LAMBDA_CHAR, ()):
+                self.lambda_targets.append(index[dest])
+            self.lambda_offsets.append(len(self.lambda_targets))
+            if state in nfa.final_states:
+                self.accept[i >> 3] |= 1 << (i & 7)
+
+    def to_bytes(self):
+        """Encode the NFA as compressed bytes. State numbers are kept, so
+        sets of state numbers stay valid for the decoded NFA."""
+        data = {field: getattr(self, field).tolist() for field in ARRAY_FIELDS}
+        data.update(num_states=self.num_states, init_state=self.init_state,
+                    symbols=self.symbols, accept=self.accept.hex())
+        text = json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+        return zlib.compress(text.encode("utf-8"))
+
+    @classmethod
+    def from_bytes(cls, blob):
+        """Decode bytes made by to_bytes"""
+        data = json.loads(zlib.decompress(blob).decode("utf-8"))
+        compact = cls.__new__(cls)
+        for field in ARRAY_FIELDS:
+            setattr(compact, field, array(INDEX_TYPE, data[field]))
+        compact.num_states = data["num_states"]
+        compact.init_state = data["init_state"]
+        compact.symbols = data["symbols"]
+        compact.symbol_ids = Symbol_Map([[atom] for atom in compact.symbols])
+        compact.accept = bytearray.fromhex(data["accept"])
+        return compact
+
+    def is_final(self, i):
+        return self.accept[i >> 3] >> (i & 7) & 1 == 1
+
+    def any_final(self, states):
+        return any(self.is_final(i) for i in states)
+
+    def closure(self, states):
+        """Get frozenset of states reachable from states on lambda edges"""
+        result = set(states)
+        to_visit = list(result)
+        offsets, targets = self.lambda_offsets, self.lambda_targets
+        while to_visit:
+            i = to_visit.pop()
+            for j in targets[offsets[i]:offsets[i + 1]]:
+                if j not in result:
+                    result.add(j)
+                    to_visit.append(j)
+        return frozenset(result)
+
+    def get_init_states(self):
+        return self.closure((self.init_state,))
+
+    def step(self, states, char):
+        """Get closed set of states reachable from states on char"""
+        symbol = self.symbol_ids[char]
+        if symbol is None:
+            return frozenset()
+        offsets, symbols, targets = self.offsets, self.edge_symbols, self.edge_targets
+        reached = set()
+        for i in states:
+            lo = bisect_left(symbols, symbol, offsets[i], offsets[i + 1])
+            hi = bisect_right(symbols, symbol, lo, offsets[i + 1])
+            reached.update(targets[lo:hi])
+        return self.closure(reached)
+
+    def successors(self, states):
+        """Get dict of symbol number -> set of states reached on that
+        symbol, in a single pass over the edges of states (no closure)"""
+        offsets, symbols, targets = self.offsets, self.edge_symbols, self.edge_targets
+        moves = {}
+        for i in states:
+            for k in range(offsets[i], offsets[i + 1]):
+                moves.setdefault(symbols[k], set()).add(targets[k])
+        return moves
+
+    def test(self, s):
+        """Test if the NFA accepts a string"""
+        s = "" if s == LAMBDA_CHAR else s
+        states = self.get_init_states()
+        for char in s:
+            states = self.step(states, char)
+            if not states:
+                return False
+        return self.any_final(states)
+
+    def to_dfa(self):
+        """Construct an equivalent DFA by subset construction"""
+        dfa = DFA()
+        init = self.get_init_states()
+        dfa_states = {init: DFA_State(subset_label(init))}
+        dfa.init_state = dfa_states[init]
+        to_visit = [init]
+        while to_visit:
+            subset = to_visit.pop()
+            state = dfa_states[subset]
+            if self.any_final(subset):
+                dfa.final_states.add(state)
+            moves = self.successors(subset)
+            for symbol, char in enumerate(self.symbols):
+                next_subset = self.closure(moves.get(symbol, ()))
+                if next_subset not in dfa_states:
+                    dfa_states[next_subset] = DFA_State(subset_label(next_subset))
+                    to_visit.append(next_subset)
+                state.add_transition(char, dfa_states[next_subset])
+        return dfa
+
+    def to_nfa(self):
+        """Construct an equivalent mutable NFA"""
+        nfa = NFA()
+        states = [NFA_State(str(i)) for i in range(self.num_states)]
+        for i, state in enumerate(states):
+            for k in range(self.offsets[i], self.offsets[i + 1]):
+                char = self.symbols[self.edge_symbols[k]]
+                state.add_transition(char, states[self.edge_targets[k]])
+            for k in range(self.lambda_offsets[i], self.lambda_offsets[i + 1]):
+                state.add_transition(LAMBDA_CHAR, states[self.lambda_targets[k]])
+            if self.is_final(i):
+                nfa.final_states.add(state)
+        nfa.init_state = states[self.init_state]
+        return nfa
+
+    def nbytes(self):
+        """Get number of bytes used by the transition and accept arrays"""
+        arrays = [getattr(self, field) for field in ARRAY_FIELDS]
+        return sum(a.itemsize * len(a) for a in arrays) + len(self.accept)
+
+    def __len__(self):
+        return self.num_states
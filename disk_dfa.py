@@ -0,0 +1,273 @@
+#! /usr/bin/python3
+
+"""Out-of-core subset construction with a disk-backed state table.
+
+Disk_DFA determinizes a Compact_NFA into a SQLite file instead of the
+dicts of frozensets used by DFA.convert_from_NFA, so the number of DFA
+states is limited by disk space rather than memory. Each DFA state is a
+row holding its NFA state subset, a hash of the subset (indexed, for
+finding states already discovered), whether it is final and, once the
+state has been expanded, its transition row: the DFA state number
+reached on each symbol.
+
+States are numbered in the order they are discovered and expanded in
+the same order, so the table itself is the work queue: states below the
+"expanded" count have rows and the rest are pending. Work is committed
+every checkpoint_interval states together with the count, so after a
+crash or interrupt, build() resumes from the last checkpoint. The NFA
+is stored in the file too, so resuming does not depend on rebuilding it
+with the same state numbers.
+
+Only a bounded working set is kept in memory: an LRU cache of subset
+hash -> state number, a batch of pending subsets and SQLite's page cache.
+
+    dfa = Disk_DFA("big.db", nfa=NFA(regex="(a|b)*a(a|b){20}"))
+    dfa.build(progress=print)
+    dfa.test("ab" * 20)
+"""
+
+import hashlib
+import sqlite3
+from array import array
+from collections import OrderedDict
+from compact_nfa import Compact_NFA, INDEX_TYPE
+from fsa import DFA, DFA_State, FSA_Error, LAMBDA_CHAR
+from metrics import METRICS, timed
+
+FORMAT_VERSION = 1
+DEFAULT_CHECKPOINT_INTERVAL = 10000
+# number of subset hashes and transition rows cached in memory
+DEFAULT_CACHE_SIZE = 100000
+# number of pending states read from the file at a time
+BATCH_SIZE = 1000
+# SQLite page cache size in KiB
+PAGE_CACHE_KIB = 64 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value);
+CREATE TABLE IF NOT EXISTS states (
+    id INTEGER PRIMARY KEY,
+    subset_hash BLOB NOT NULL UNIQUE,
+    subset BLOB NOT NULL,
+    final INTEGER NOT NULL,
+    row BLOB
+);
+"""
+
+def subset_key(subset):
+    """Get (hash, packed bytes) of a set of NFA state numbers. With 128-bit
+    hashes, a collision is not expected before about 2**64 states."""
+    packed = array(INDEX_TYPE, sorted(subset)).tobytes()
+    return hashlib.blake2b(packed, digest_size=16).digest(), packed
+
+class Disk_DFA:
+    """DFA whose states and transitions are stored in a SQLite file.
+
+    Disk_DFA(path, nfa) starts a new determinization of nfa (an NFA or
+    Compact_NFA), or continues the one in path. Disk_DFA(path) opens an
+    existing file, to resume its build or to test strings."""
+    def __init__(self, path, nfa=None, cache_size=DEFAULT_CACHE_SIZE):
+        self.path = path
+        self.cache_size = cache_size
+        self.ids = OrderedDict()
+        self.rows = OrderedDict()
+        self.db = sqlite3.connect(path)
+        try:
+            self.db.executescript(SCHEMA)
+            self.db.execute(f"PRAGMA cache_size = -{PAGE_CACHE_KIB}")
+            self.open(nfa)
+        except sqlite3.DatabaseError as e:
+            self.db.close()
+            raise FSA_Error(f"cannot use {path}: {e}") from e
+        except BaseException:
+            self.db.close()
+            raise
+        self.symbol_ids = self.nfa.symbol_ids
+
+    def get_meta(self, name):
+        row = self.db.execute("SELECT value FROM meta WHERE name = ?",
+                              (name,)).fetchone()
+        return None if row is None else row[0]
+
+    def set_meta(self, name, value):
+        self.db.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (name, value))
+
+    def open(self, nfa):
+        """Load the stored NFA and progress, or start from nfa"""
+        version = self.get_meta("version")
+        if version is None:
+            if nfa is None:
+                raise FSA_Error(f"{self.path} holds no automaton; give an NFA")
+            self.nfa = nfa if isinstance(nfa, Compact_NFA) else Compact_NFA(nfa)
+            with self.db:
+                self.set_meta("version", FORMAT_VERSION)
+                self.set_meta("nfa", self.nfa.to_bytes())
+                self.set_meta("expanded", 0)
+                self.num_states = 0
+                self.init = self.get_id(self.nfa.get_init_states())
+            return
+        if version != FORMAT_VERSION:
+            raise FSA_Error(f"{self.path} has unsupported format version {version}")
+        self.nfa = Compact_NFA.from_bytes(self.get_meta("nfa"))
+        if nfa is not None:
+            # the stored NFA is used; check that nfa is plausibly the same
+            if not isinstance(nfa, Compact_NFA):
+                nfa = Compact_NFA(nfa)
+            if (len(nfa), nfa.symbols, len(nfa.edge_targets)) != (
+                    len(self.nfa), self.nfa.symbols, len(self.nfa.edge_targets)):
+                raise FSA_Error(f"{self.path} holds a different automaton")
+        self.num_states = self.db.execute("SELECT count(*) FROM states").fetchone()[0]
+        self.init = 0
+
+    @property
+    def expanded(self):
+        return self.get_meta("expanded")
+
+    def is_complete(self):
+        """Test if every discovered state has been expanded"""
+        return self.expanded == self.num_states
+
+    def get_id(self, subset):
+        """Get the number of the DFA state for a set of NFA states,
+        adding a new pending state if it was not discovered yet"""
+        key, packed = subset_key(subset)
+        state_id = self.ids.get(key)
+        if state_id is not None:
+            self.ids.move_to_end(key)
+            return state_id
+        row = self.db.execute("SELECT id FROM states WHERE subset_hash = ?",
+                              (key,)).fetchone()
+        if row is None:
+            state_id = self.num_states
+            self.db.execute("INSERT INTO states VALUES (?, ?, ?, ?, NULL)",
+                            (state_id, key, packed, self.nfa.any_final(subset)))
+            self.num_states += 1
+            if METRICS.enabled:
+                METRICS.count("disk_states_created")
+        else:
+            state_id = row[0]
+        self.ids[key] = state_id
+        if len(self.ids) > self.cache_size:
+            self.ids.popitem(last=False)
+        return state_id
+
+    @timed("disk_determinize")
+    def build(self, checkpoint_interval=DEFAULT_CHECKPOINT_INTERVAL,
+              progress=None, max_states=None):
+        """Expand pending states until none are left, committing a
+        checkpoint every checkpoint_interval states. progress is called
+        with (states expanded, states discovered) at each checkpoint. If
+        max_states is given, stop after expanding that many states; call
+        build again to continue. Returns True if the DFA is complete."""
+        nfa = self.nfa
+        num_symbols = len(nfa.symbols)
+        expanded = self.expanded
+        since_checkpoint = 0
+        stop = None if max_states is None else expanded + max_states
+        try:
+            while expanded < self.num_states and expanded != stop:
+                limit = BATCH_SIZE if stop is None else min(BATCH_SIZE, stop - expanded)
+                batch = self.db.execute(
+                    "SELECT id, subset FROM states WHERE id >= ? ORDER BY id LIMIT ?",
+                    (expanded, limit)).fetchall()
+                for state_id, packed in batch:
+                    subset = array(INDEX_TYPE)
+                    subset.frombytes(packed)
+                    moves = nfa.successors(subset)
+                    # many symbols lead to the same set, often the empty set
+                    reached = {}
+                    row = array(INDEX_TYPE)
+                    for symbol in range(num_symbols):
+                        targets = frozenset(moves.get(symbol, ()))
+                        if targets not in reached:
+                            reached[targets] = self.get_id(nfa.closure(targets))
+                        row.append(reached[targets])
+                    self.db.execute("UPDATE states SET row = ? WHERE id = ?",
+                                    (row.tobytes(), state_id))
+                    expanded += 1
+                    since_checkpoint += 1
+                    if since_checkpoint == checkpoint_interval:
+                        self.checkpoint(expanded, progress)
+                        since_checkpoint = 0
+            self.checkpoint(expanded, progress)
+        except BaseException:
+            # keep the file at the last checkpoint
+            self.db.rollback()
+            self.ids.clear()
+            self.num_states = self.db.execute("SELECT count(*) FROM states").fetchone()[0]
+            raise
+        return self.is_complete()
+
+    def checkpoint(self, expanded, progress=None):
+        """Commit the states expanded so far"""
+        with self.db:
+            self.set_meta("expanded", expanded)
+        if progress is not None:
+            progress(expanded, self.num_states)
+
+    def get_row(self, state_id):
+        row = self.rows.get(state_id)
+        if row is None:
+            blob = self.db.execute("SELECT row FROM states WHERE id = ?",
+                                   (state_id,)).fetchone()[0]
+            if blob is None:
+                raise FSA_Error("DFA is not complete; run build first")
+            row = array(INDEX_TYPE)
+            row.frombytes(blob)
+            self.rows[state_id] = row
+            if len(self.rows) > self.cache_size:
+                self.rows.popitem(last=False)
+        else:
+            self.rows.move_to_end(state_id)
+        return row
+
+    def is_final(self, state_id):
+        return self.db.execute("SELECT final FROM states WHERE id = ?",
+                               (state_id,)).fetchone()[0] == 1
+
+    def test(self, s, trace=False):
+        """Test if the DFA accepts a string"""
+        s = "" if s == LAMBDA_CHAR else s
+        if trace:
+            print("Remaining String    State")
+            print("-" * 80)
+        state = self.init
+        for i, char in enumerate(s):
+            if trace:
+                print(f"{s[i:]:20}{state}")
+            symbol = self.symbol_ids[char]
+            if symbol is None:
+                return False
+            state = self.get_row(state)[symbol]
+        if trace:
+            print(f"{'':20}{state}")
+        return self.is_final(state)
+
+    def to_dfa(self):
+        """Load the complete DFA into memory"""
+        if not self.is_complete():
+            raise FSA_Error("DFA is not complete; run build first")
+        states = [DFA_State(str(i)) for i in range(self.num_states)]
+        dfa = DFA()
+        dfa.init_state = states[self.init]
+        for state_id, final, blob in self.db.execute(
+                "SELECT id, final, row FROM states ORDER BY id"):
+            row = array(INDEX_TYPE)
+            row.frombytes(blob)
+            for char, dest in zip(self.nfa.symbols, row):
+                states[state_id].add_transition(char, states[dest])
+            if final:
+                dfa.final_states.add(states[state_id])
+        return dfa
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self.num_states
@@ -1,8 +1,11 @@
 #! /usr/bin/python3
 
 from collections import defaultdict
+from bisect import bisect_right
+import random
 import xml.etree.ElementTree as ET
 from regex import *
+from metrics import METRICS, timed
 
 LABEL_CHAR = "@"
 COMMENT_CHAR = "#"
@@ -58,8 +61,16 @@ class Transition_Graph:
             elif first_char == FINAL_CHAR:
                 self.final_state_labels.add(current_state_label)
             else:
-                self.state_dict[current_state_label][first_char] += words[1:]
-                self.transition_chars.add(first_char)
+                char = first_char
+                # character class label such as [a-z]
+                if first_char == CLASS_OPEN and CLASS_CLOSE in words[0][2:]:
+                    label = words[0][:words[0].index(CLASS_CLOSE, 2) + 1]
+                    try:
+                        char = class_label(class_intervals(label))
+                    except SyntaxError as e:
+                        raise FSA_Error(f"Invalid character class {label}: {e}")
+                self.state_dict[current_state_label][char] += words[1:]
+                self.transition_chars.add(char)
   
     def load_jflap(self, filename):
         """load from jflap xml file"""
@@ -89,6 +100,10 @@ class Transition_Graph:
         # no lambda transitions
         if LAMBDA_CHAR in self.transition_chars:
             return False
+        # no overlapping character classes
+        atoms = atomize(self.transition_chars)
+        if any(atoms[char] != [char] for char in self.transition_chars):
+            return False
         for transitions in self.state_dict.values():
             # total transition function
             if self.transition_chars != set(transitions.keys()):
@@ -103,6 +118,18 @@ class Transition_Graph:
 class State:
     def __init__(self, label=""):
         self.label = label
+        # Interval_Table of transitions on character classes, built on use
+        self.class_table = None
+
+    def get_class_table(self):
+        if self.class_table is None:
+            self.class_table = Interval_Table(
+                (low, high, dest)
+                for label, dest_states in self.get_transitions().items()
+                if is_class_label(label)
+                for low, high in class_intervals(label)
+                for dest in dest_states)
+        return self.class_table
 
     def __repr__(self):
         return self.label
@@ -125,6 +152,7 @@ class NFA_State(State):
         def change_incoming(char, state):
             state.add_transition(char, self)
             state.outgoing[char].remove(src)
+            state.class_table = None
 
         src.iterate_over_incoming(change_incoming)
         src.iterate_over_outgoing(change_outgoing)
@@ -147,38 +175,74 @@ class NFA_State(State):
                 new_node = Cat_Node(Cat_Node(in_node, loops_node), out_node)
                 orig.GTG_out.add((new_node, dest))
                 dest.GTG_in.add((new_node, orig))
+        if METRICS.enabled:
+            # star node, union nodes for loops, two cat nodes per in/out pair
+            new_nodes = 1 + len(loops) + 2 * len(non_loops_out) * len(non_loops_in)
+            METRICS.count("suppress_nodes_created", new_nodes)
         for out_node, dest in non_loops_out:
             dest.GTG_in.discard((out_node, self))
         for in_node, orig, in non_loops_in:
             orig.GTG_out.discard((in_node, self))
 
-    def find_all_reachable(self, char, visited=None):
+    def find_all_reachable(self, char):
         """Get all states reachable by consuming char"""
-        if visited is None:
-            visited = set()
-        # prevent infinite recursion on lambda cycles
-        if self in visited:
-            return set()
-        
-        states = set()
-        if char == LAMBDA_CHAR:
-            states.add(self)
-        
-        # try transitions on char
-        if char != LAMBDA_CHAR:
-            for next_state in self.outgoing[char]:
-                states |= next_state.find_all_reachable(LAMBDA_CHAR)
+        return NFA_State.move((self,), char)
 
-        # try lambda-transitions
-        visited.add(self)
-        for next_state in self.outgoing[LAMBDA_CHAR]:
-            states |= next_state.find_all_reachable(char, visited)
+    @staticmethod
+    def lambda_closure(states):
+        """Get set of the states reachable from states by lambda
+        transitions. The search is iterative, since regexes like
+        (a?){500} make long chains of lambda transitions."""
+        if METRICS.enabled:
+            METRICS.count("closure_computations")
+        closure = set(states)
+        to_visit = list(closure)
+        while to_visit:
+            for next_state in to_visit.pop().outgoing.get(LAMBDA_CHAR, ()):
+                if next_state not in closure:
+                    closure.add(next_state)
+                    to_visit.append(next_state)
+        return closure
 
-        return states
+    @staticmethod
+    def move(states, char):
+        """Get set of the states reachable from states by consuming char"""
+        closure = NFA_State.lambda_closure(states)
+        if char == LAMBDA_CHAR:
+            return closure
+        targets = set()
+        for state in closure:
+            targets.update(state.next_states(char))
+        return NFA_State.lambda_closure(targets)
 
     def add_transition(self, char, state):
         self.outgoing[char].add(state)
         state.incoming[char].add(self)
+        self.class_table = None
+
+    def remove_transition(self, char, state):
+        self.outgoing[char].discard(state)
+        state.incoming[char].discard(self)
+        self.class_table = None
+
+    def next_states(self, char):
+        """Get states reached directly by consuming char, including
+        transitions on character classes containing char"""
+        states = self.outgoing.get(char, ())
+        table = self.class_table
+        if table is None:
+            table = self.get_class_table()
+        if table.starts:
+            class_states = table.get(char)
+            if class_states:
+                return set(states).union(class_states)
+        return states
+
+    def num_outgoing(self):
+        return sum(len(states) for states in self.outgoing.values())
+
+    def num_incoming(self):
+        return sum(len(states) for states in self.incoming.values())
 
     def has_outgoing(self):
         return len(self.outgoing) != 0
@@ -233,17 +297,214 @@ class DFA_State(State):
     
     def add_transition(self, char, state):
         self.transitions[char] = state
+        self.class_table = None
+
+    def next(self, char):
+        """Get state reached by consuming char, or None"""
+        state = self.transitions.get(char)
+        if state is None:
+            class_states = self.get_class_table().get(char)
+            if class_states:
+                state = class_states[0]
+        return state
 
     def get_transitions(self):
         """return transitions in NFA format"""
         return {char: [state] for char, state in self.transitions.items()}
 
+class Symbol_Map(dict):
+    """Map of characters to the numbers of symbol classes (lists of
+    transition labels). Characters of character class labels are found by
+    binary search on first use, then cached. Characters in no class map
+    to default."""
+    def __init__(self, symbol_classes, default=None):
+        super().__init__()
+        self.default = default
+        intervals = []
+        for number, symbol_class in enumerate(symbol_classes):
+            for label in symbol_class:
+                if is_class_label(label):
+                    intervals += [(low, high, number)
+                                  for low, high in class_intervals(label)]
+                else:
+                    self[label] = number
+        self.class_table = Interval_Table(intervals)
+
+    def __missing__(self, char):
+        numbers = self.class_table.get(char)
+        number = numbers[0] if numbers else self.default
+        self[char] = number
+        return number
+
 class FSA:
     """Base class for finite state automata"""
+    # frozen automata may be shared and must not be modified
+    frozen = False
+    # live states saved by cached_live_states
+    _live_states = None
+
+    def freeze(self):
+        self.frozen = True
+
+    def check_modifiable(self):
+        """Raise FSA_Error if self is frozen"""
+        if self.frozen:
+            raise FSA_Error("Cannot modify a frozen automaton; copy it first")
+
     def label_states(self, start=0):
+        self.check_modifiable()
         for count, state in enumerate(self.get_state_list(), start):
             state.label = str(count)
 
+    def get_live_states(self):
+        """Get set of states from which a final state is reachable"""
+        predecessors = defaultdict(set)
+        for state in self.get_state_list():
+            for dest_states in state.get_transitions().values():
+                for dest in dest_states:
+                    predecessors[dest].add(state)
+        live = set()
+        to_visit = list(self.final_states)
+        while to_visit:
+            state = to_visit.pop()
+            if state not in live:
+                live.add(state)
+                to_visit.extend(predecessors[state])
+        return live
+
+    def get_symbol_classes(self):
+        """Partition the alphabet into classes of symbols that lead to the
+        same states from every state. Character class labels are first
+        split into disjoint atoms, so the symbols are single characters or
+        atom labels. Returns list of lists of symbols, sorted by their
+        first character."""
+        atoms = atomize(self.get_alphabet())
+        signatures = {atom: [] for label_atoms in atoms.values()
+                      for atom in label_atoms}
+        # atoms with equal signatures reach the same states; atoms covered
+        # by several labels of a state get one entry per label
+        for i, state in enumerate(self.get_state_list()):
+            for char, dest_states in state.get_transitions().items():
+                if char != LAMBDA_CHAR and dest_states:
+                    dest_states = frozenset(dest_states)
+                    for atom in atoms[char]:
+                        signatures[atom].append((i, dest_states))
+        classes = defaultdict(list)
+        for atom in sorted(signatures, key=first_char):
+            classes[tuple(signatures[atom])].append(atom)
+        return list(classes.values())
+
+    def get_chars(self):
+        """Get sorted list of the characters matched by transitions"""
+        return sorted({char for label in self.get_alphabet()
+                       for char in label_chars(label)})
+
+    def cached_live_states(self):
+        """Get set of live states, computed on first use. Call
+        forget_live_states after changing the transitions."""
+        if self._live_states is None:
+            self._live_states = self.get_live_states()
+        return self._live_states
+
+    def forget_live_states(self):
+        self._live_states = None
+
+    def reverse(self):
+        """Make an NFA accepting the reverse of each accepted string. Each
+        state's incoming transitions become its outgoing ones, the initial
+        state becomes the only final state, and the new initial state
+        has lambda transitions to the old final states."""
+        nfa = NFA(dfa=self) if isinstance(self, DFA) else self
+        states = nfa.get_state_list()
+        new_states = {s: NFA_State(s.label) for s in states}
+        for state, new_state in new_states.items():
+            for char, sources in state.incoming.items():
+                for source in sources:
+                    # sources unreachable from the initial state are dropped
+                    if source in new_states:
+                        new_state.add_transition(char, new_states[source])
+        reversed_nfa = NFA()
+        finals = [new_states[s] for s in states if s in nfa.final_states]
+        if len(finals) == 1:
+            reversed_nfa.init_state = finals[0]
+        else:
+            reversed_nfa.init_state = NFA_State()
+            for state in finals:
+                reversed_nfa.init_state.add_transition(LAMBDA_CHAR, state)
+        reversed_nfa.final_states = {new_states[nfa.init_state]}
+        return reversed_nfa
+
+    @timed("brzozowski")
+    def brzozowski(self):
+        """Make the minimal DFA by Brzozowski's method: determinizing the
+        reversed automaton gives a DFA with no two states that accept the
+        same strings, so reversing and determinizing it again gives the
+        minimal DFA. Unlike reduce, this works on NFAs and never builds
+        the DFA of the original automaton, but the intermediate DFA can
+        be exponentially larger than the minimal one."""
+        nfa = DFA(nfa=self.reverse()).reverse()
+        dfa = DFA()
+        subsets = dfa.convert_from_NFA(nfa)
+        # the method assumes a set of initial states, but a reversal with
+        # several initial states has a new one with lambda transitions to
+        # them, which only the initial subset contains. If the subset
+        # without it was also reached, the two DFA states are equivalent.
+        init = nfa.init_state
+        if (set(init.outgoing) == {LAMBDA_CHAR} and not init.has_incoming()
+                and init not in nfa.final_states):
+            init_subset = frozenset(init.find_all_reachable(LAMBDA_CHAR))
+            twin = subsets.get(init_subset - {init})
+        else:
+            twin = None
+        if twin is not None:
+            dfa.final_states.discard(dfa.init_state)
+            dfa.init_state = twin
+        return dfa
+
+    def reject_position(self, s):
+        """Get the number of characters of s read when rejection became
+        certain, or None if s is accepted"""
+        s = "" if s == LAMBDA_CHAR else s
+        live = self.cached_live_states()
+        states = self.get_init_states() & live
+        for i, char in enumerate(s):
+            if not states:
+                return i
+            states = self.get_next_states(states, char) & live
+        if states.isdisjoint(self.final_states):
+            return len(s)
+        return None
+
+    def enumerate(self, max_len, limit=None):
+        """Generate accepted strings of length <= max_len in shortlex order.
+        Only the current frontier of (string, states) pairs is kept in memory,
+        and states that cannot reach a final state are pruned."""
+        # the limit is otherwise only checked after a string is yielded
+        if limit is not None and limit <= 0:
+            return
+        live = self.get_live_states()
+        alphabet = self.get_chars()
+        init_states = self.get_init_states() & live
+        frontier = [("", init_states)] if init_states else []
+        count = 0
+        for length in range(max_len + 1):
+            next_frontier = []
+            for s, states in frontier:
+                if states & self.final_states:
+                    yield s
+                    count += 1
+                    if count == limit:
+                        return
+                if length == max_len:
+                    continue
+                for char in alphabet:
+                    next_states = self.get_next_states(states, char) & live
+                    if next_states:
+                        next_frontier.append((s + char, next_states))
+            if not next_frontier:
+                return
+            frontier = next_frontier
+
     def write_file(self, filename):
         """Write transition graph to file"""
         states = self.get_state_list()
@@ -321,8 +582,13 @@ class NFA(FSA):
         elif tg is not None:
             self.load_from_transition_graph(tg)
         elif regex is not None:
-            self.eval_node(parse(regex))
-            self.label_states()
+            self.eval_regex(parse(regex))
+
+    @timed("nfa_construction")
+    def eval_regex(self, tree):
+        """Create FSA from the parse tree of a regex string"""
+        self.eval_node(tree)
+        self.label_states()
 
     def load_from_dfa(self, dfa):
         """Construct nfa from a dfa"""
@@ -351,6 +617,196 @@ class NFA(FSA):
                 for dest_label in labels:
                     state.add_transition(char, state_dict[dest_label])
 
+    def copy(self):
+        """Make an equivalent NFA with new copies of the reachable states"""
+        new_states = {s: NFA_State(s.label) for s in self.get_state_list()}
+        nfa = NFA()
+        for state, new_state in new_states.items():
+            for char, dest_states in state.outgoing.items():
+                for dest in dest_states:
+                    new_state.add_transition(char, new_states[dest])
+        nfa.init_state = new_states[self.init_state]
+        nfa.final_states = {new_states[s] for s in self.final_states
+                            if s in new_states}
+        return nfa
+
+    def trim(self):
+        """Make an equivalent NFA without the states that are unreachable
+        or cannot reach a final state"""
+        live = self.get_live_states()
+        useful = {s for s in self.get_state_list() if s in live}
+        new_states = {s: NFA_State(s.label) for s in useful}
+        if self.init_state not in useful:
+            new_states[self.init_state] = NFA_State(self.init_state.label)
+        nfa = NFA()
+        for state, new_state in new_states.items():
+            for char, dest_states in state.outgoing.items():
+                for dest in dest_states:
+                    if dest in useful:
+                        new_state.add_transition(char, new_states[dest])
+        nfa.init_state = new_states[self.init_state]
+        nfa.final_states = {new_states[s] for s in self.final_states
+                            if s in useful}
+        return nfa
+
+    def get_lambda_closures(self, states):
+        """Get dict of each state to the set of states reachable from it
+        using only lambda transitions"""
+        closures = {}
+        for state in states:
+            closure = {state}
+            to_visit = [state]
+            while to_visit:
+                for next_state in to_visit.pop().outgoing.get(LAMBDA_CHAR, ()):
+                    if next_state in closure:
+                        continue
+                    if next_state in closures:
+                        closure |= closures[next_state]
+                    else:
+                        closure.add(next_state)
+                        to_visit.append(next_state)
+            closures[state] = closure
+        return closures
+
+    @timed("remove_lambdas")
+    def remove_lambdas(self):
+        """Make an equivalent NFA without lambda transitions. Each state
+        takes the transitions and finality of its lambda closure. States
+        that were entered only by lambda transitions are left out."""
+        closures = self.get_lambda_closures(self.get_state_list())
+        new_states = {self.init_state: NFA_State(self.init_state.label)}
+        nfa = NFA()
+        nfa.init_state = new_states[self.init_state]
+        to_visit = [self.init_state]
+        while to_visit:
+            state = to_visit.pop()
+            new_state = new_states[state]
+            closure = closures[state]
+            if not closure.isdisjoint(self.final_states):
+                nfa.final_states.add(new_state)
+            for member in closure:
+                for char, dest_states in member.outgoing.items():
+                    if char == LAMBDA_CHAR:
+                        continue
+                    for dest in dest_states:
+                        if dest not in new_states:
+                            new_states[dest] = NFA_State(dest.label)
+                            to_visit.append(dest)
+                        new_state.add_transition(char, new_states[dest])
+        return nfa
+
+    def merge_lambda_states(self):
+        """Remove lambda transitions by merging the states they join, where
+        this does not change the language. Modifies self."""
+        self.check_modifiable()
+        changed = True
+        while changed:
+            changed = False
+            removed = set()
+            for state in self.get_state_list():
+                if state in removed:
+                    continue
+                # lambda loops have no effect
+                if state in state.outgoing.get(LAMBDA_CHAR, ()):
+                    state.remove_transition(LAMBDA_CHAR, state)
+                    changed = True
+
+                # state's only transition is a lambda to dest: move its
+                # incoming transitions to dest
+                dest = self._only_lambda(state.outgoing, state.num_outgoing())
+                if (dest is not None and (state not in self.final_states
+                                          or dest in self.final_states)):
+                    state.remove_transition(LAMBDA_CHAR, dest)
+                    dest.merge(state)
+                    if state == self.init_state:
+                        self.init_state = dest
+                    self.final_states.discard(state)
+                    removed.add(state)
+                    changed = True
+                    continue
+
+                # state's only incoming transition is a lambda from orig:
+                # move its outgoing transitions to orig
+                orig = self._only_lambda(state.incoming, state.num_incoming())
+                if orig is not None and state != self.init_state:
+                    orig.remove_transition(LAMBDA_CHAR, state)
+                    orig.merge(state)
+                    if state in self.final_states:
+                        self.final_states.remove(state)
+                        self.final_states.add(orig)
+                    removed.add(state)
+                    changed = True
+        self.forget_live_states()
+
+    @staticmethod
+    def _only_lambda(transitions, num_transitions):
+        """Get the other state of a state's only transition if it is a
+        lambda transition, otherwise None"""
+        if num_transitions == 1 and transitions.get(LAMBDA_CHAR):
+            return next(iter(transitions[LAMBDA_CHAR]))
+        return None
+
+    def bisimulation_classes(self, states, backward=False):
+        """Partition states into classes of forward (or backward)
+        bisimilar states. Returns dict of state to class number."""
+        if backward:
+            classes = {s: int(s == self.init_state) for s in states}
+            get_edges = lambda s: s.incoming
+        else:
+            classes = {s: int(s in self.final_states) for s in states}
+            get_edges = lambda s: s.outgoing
+        num_classes = len(set(classes.values()))
+
+        # split classes by the classes reached on each char until stable
+        while True:
+            class_ids = {}
+            classes = {s: class_ids.setdefault(
+                (classes[s], frozenset((char, classes[t])
+                                       for char, edge_states in get_edges(s).items()
+                                       for t in edge_states)), len(class_ids))
+                       for s in states}
+            if len(class_ids) == num_classes:
+                return classes
+            num_classes = len(class_ids)
+
+    def quotient(self, states, classes):
+        """Make NFA with one state per class of states"""
+        new_states = {}
+        for state in states:
+            new_states.setdefault(classes[state], NFA_State(state.label))
+        nfa = NFA()
+        for state in states:
+            new_state = new_states[classes[state]]
+            for char, dest_states in state.outgoing.items():
+                for dest in dest_states:
+                    new_dest = new_states[classes[dest]]
+                    if char != LAMBDA_CHAR or new_dest != new_state:
+                        new_state.add_transition(char, new_dest)
+        nfa.init_state = new_states[classes[self.init_state]]
+        nfa.final_states = {new_states[classes[s]] for s in self.final_states
+                            if s in classes}
+        return nfa
+
+    @timed("nfa_reduce")
+    def reduce(self):
+        """Make an equivalent NFA with fewer states. Useless states are
+        removed, then states are merged across removable lambda
+        transitions and by forward and backward bisimulation."""
+        nfa = self.trim()
+        nfa.merge_lambda_states()
+        num_states = len(nfa.get_state_list())
+        while True:
+            for backward in (False, True):
+                states = nfa.get_state_list()
+                nfa = nfa.quotient(states, nfa.bisimulation_classes(states, backward))
+            nfa.merge_lambda_states()
+            new_num_states = len(nfa.get_state_list())
+            if METRICS.enabled:
+                METRICS.count("nfa_reduce_rounds")
+            if new_num_states == num_states:
+                return nfa
+            num_states = new_num_states
+
     def get_state_list(self):
         """Get list of reachable states in DFS traversal order."""
         state_list = []
@@ -400,9 +856,17 @@ class NFA(FSA):
 
     def eval_cat_node(self, node):
         """Create FSA from regex cat node"""
-        left = NFA(node=node.left)
-        right = NFA(node=node.right)
-
+        self.concatenate(NFA(node=node.left), NFA(node=node.right))
+
+    def concatenate(self, left, right):
+        """Make FSA accepting the concatenation of the languages of two
+        NFAs, reusing their states. Frozen NFAs are copied first."""
+        self.check_modifiable()
+        left, right = (nfa.copy() if nfa.frozen else nfa for nfa in (left, right))
+        if not left.final_states:
+            # left accepts nothing, and neither does the concatenation
+            self.init_state = left.init_state
+            return
         # merge final states of left node
         to_merge = []
 
@@ -431,7 +895,14 @@ class NFA(FSA):
 
     def eval_star_node(self, node):
         """Create FSA from regex star node"""
-        child = NFA(node=node.child)
+        self.star(NFA(node=node.child))
+
+    def star(self, child):
+        """Make FSA accepting the Kleene closure of the language of an
+        NFA, reusing its states. A frozen NFA is copied first."""
+        self.check_modifiable()
+        if child.frozen:
+            child = child.copy()
         if child.init_state.has_incoming():
             self.init_state = NFA_State()
             self.init_state.add_transition(LAMBDA_CHAR, child.init_state)
@@ -444,6 +915,53 @@ class NFA(FSA):
                 self.init_state.merge(state)
         self.final_states = {self.init_state}
 
+    def optional(self, child):
+        """Make FSA accepting the language of an NFA or the empty string,
+        reusing its states. A frozen NFA is copied first."""
+        self.check_modifiable()
+        if child.frozen:
+            child = child.copy()
+        self.init_state = child.init_state
+        if child.init_state.has_incoming():
+            self.init_state = NFA_State()
+            self.init_state.add_transition(LAMBDA_CHAR, child.init_state)
+        self.final_states = child.final_states | {self.init_state}
+
+    def eval_repeat_node(self, node):
+        """Create FSA from regex repeat node from copies of the child NFA,
+        which is only built once. r{m,n} is m copies followed by n-m
+        nested optional ones, (r(r(r)?)?)?, and r{m,} is m copies followed
+        by r*. Copies are joined like the operands of a cat node, so the
+        final states of one are merged into the initial state of the next
+        instead of adding a lambda transition for each copy."""
+        child = NFA(node=node.child)
+        tail = None
+        if node.high is None:
+            tail = NFA()
+            tail.star(child.copy())
+        else:
+            for i in range(node.high - node.low):
+                part = child.copy()
+                if tail is not None:
+                    joined = NFA()
+                    joined.concatenate(part, tail)
+                    part = joined
+                tail = NFA()
+                tail.optional(part)
+        parts = [child.copy() for i in range(node.low)]
+        if tail is not None:
+            parts.append(tail)
+        if not parts:
+            self.eval_leaf_node(LAMBDA_CHAR)
+            return
+        result = parts[0]
+        for part in parts[1:]:
+            joined = NFA()
+            joined.concatenate(result, part)
+            result = joined
+        self.init_state = result.init_state
+        self.final_states = result.final_states
+
     def eval_leaf_node(self, char=None):
         """Create FSA from character, lambda, or null node"""
         init = NFA_State()
@@ -475,6 +993,9 @@ class NFA(FSA):
 
         elif isinstance(node, Star_Node):
             self.eval_star_node(node)
+
+        elif isinstance(node, Repeat_Node):
+            self.eval_repeat_node(node)
     
     def GTG_init_final(self):
         """Add states so that init has no incoming transition and
@@ -489,8 +1010,12 @@ class NFA(FSA):
             fstate.GTG_out.add((LAMBDA_NODE, self.GTG_final))
             self.GTG_final.GTG_in.add((LAMBDA_NODE, fstate))
             
+    @timed("to_regex")
     def to_regex(self):
         """Create regex accepting the same language as self"""
+        # the conversion uses scratch data stored in the states
+        if self.frozen:
+            return self.copy().to_regex()
         states = self.get_state_list()
         for s in states:
             s.make_GTG_sets()
@@ -502,7 +1027,7 @@ class NFA(FSA):
 
         init_out_nodes = [out_node for out_node, _ in self.GTG_init.GTG_out]
         parse_tree = union_all(init_out_nodes)
-        return simplify(parse_tree).regex()
+        return condense(simplify(parse_tree)).regex()
 
     def test(self, s, trace=False):
         """Test if NFA accepts a string using multiple simultaneous paths"""
@@ -510,36 +1035,39 @@ class NFA(FSA):
             print("Remaining String    States")
             print("-" * 80)
 
-        def _test(s, current_states):
-            # follow lambda transitions
-            lambda_states = set()
-            for state in current_states:
-                lambda_states |= state.find_all_reachable(LAMBDA_CHAR)
-            current_states |= lambda_states
+        live = self.cached_live_states()
+        s = "" if s == LAMBDA_CHAR else s
+        if METRICS.enabled:
+            METRICS.count("nfa_tests")
+
+        current_states = {self.init_state}
+        for i in range(len(s) + 1):
+            # follow lambda transitions, dropping states that cannot
+            # reach a final state
+            current_states = NFA_State.lambda_closure(current_states)
+            current_states &= live
 
             if trace:
-                print(f"{s:20}{current_states}")
+                print(f"{s[i:]:20}{current_states}")
+            if METRICS.enabled:
+                METRICS.count("nfa_states_visited", len(current_states))
 
-            # base case: no path to a final state on s
+            # no path to a final state on the rest of s
             if len(current_states) == 0:
                 return False
 
             # End of input: check if any states are final
-            if s == "":
-                return any([s in self.final_states for s in current_states])
-            
-            # Not end of input:follow non-lambda transitions
+            if i == len(s):
+                return any(state in self.final_states
+                           for state in current_states)
+
+            # Not end of input: follow non-lambda transitions
             new_states = set()
             for state in current_states:
-                # Find states reachable on next char in string
-                reachable = state.outgoing.get(s[0], ())
-                # for each state, create a new path by extending existing path
-                for next_state in reachable:
-                    new_states.add(next_state)
-            return _test(s[1:], new_states)
-
-        s = "" if s == LAMBDA_CHAR else s
-        return _test(s, {self.init_state})
+                for next_state in state.next_states(s[i]):
+                    if next_state in live:
+                        new_states.add(next_state)
+            current_states = new_states
     
     def test_backtrack(self, s, trace=False):
         """Test if NFA accepts string using backtracking"""
@@ -555,6 +1083,8 @@ class NFA(FSA):
             current_config = f"{path:20}{s:20}"
             if trace:
                 print(current_config + "entering state")
+            if METRICS.enabled:
+                METRICS.count("backtrack_states_visited")
 
             # Success: reached end of string in final state
             if s == "" and state in self.final_states:
@@ -586,7 +1116,7 @@ class NFA(FSA):
                 return False
             
             # Try non-lambda transitions
-            for next_state in state.outgoing.get(s[0], ()):
+            for next_state in state.next_states(s[0]):
                 if _test(s[1:], next_state, path=path):
                     return True
                     
@@ -596,6 +1126,8 @@ class NFA(FSA):
             return False
 
         s = "" if s == LAMBDA_CHAR else s
+        if METRICS.enabled:
+            METRICS.count("backtrack_tests")
         return _test(s, self.init_state)
     
     def get_alphabet(self):
@@ -603,13 +1135,33 @@ class NFA(FSA):
         states = self.get_state_list()
         alph =  reduce(set.union, [set(s.outgoing.keys()) for s in states], set())
         return alph - {LAMBDA_CHAR}    
+
+    def get_init_states(self):
+        """Get set of states active before any input is read"""
+        return self.init_state.find_all_reachable(LAMBDA_CHAR)
+
+    def get_next_states(self, states, char):
+        """Get set of states reachable from states by consuming char"""
+        return NFA_State.move(states, char)
     
+def read_words(filename):
+    """Generate the words of a word list file, one per line. Blank lines
+    are skipped; a line containing only ^ is the empty word."""
+    with open(filename, encoding="utf-8") as file:
+        for line in file:
+            word = line.strip()
+            if word:
+                yield word
+
 class DFA(FSA):
-    def __init__(self, nfa=None, filename=None, jflap=None, tg=None):
+    def __init__(self, nfa=None, filename=None, jflap=None, tg=None,
+                 words=None):
         self.init_state = None
         self.final_states = set()
 
-        if filename:
+        if words is not None:
+            self.load_from_words(words)
+        elif filename:
             tg = Transition_Graph(filename=filename)
         elif jflap:
             tg = Transition_Graph(jflap=jflap)
@@ -634,9 +1186,97 @@ class DFA(FSA):
             for char, labels in transitions.items():
                 state.add_transition(char, state_dict[labels[0]])
 
+    @timed("load_from_words")
+    def load_from_words(self, words):
+        """Construct the minimal DFA accepting a finite list of words.
+
+        Words are added one at a time, in any order, and the automaton is
+        kept minimal after each one (Daciuk et al., "Incremental
+        construction of minimal acyclic finite-state automata", 2000), so
+        memory is proportional to the minimal DFA rather than the list.
+        States are merged through a register of (final, transitions)
+        signatures. States shared by several words (confluence states) are
+        cloned before a new word changes them. The DFA has no dead state:
+        strings leaving the word tree have no transition."""
+        self.init_state = DFA_State()
+        finals = self.final_states
+        register = {}
+        # register key of each registered state
+        keys = {}
+        incoming = defaultdict(int)
+
+        for word in words:
+            if LAMBDA_CHAR in word and word != LAMBDA_CHAR:
+                raise FSA_Error(f"word {word!r} contains {LAMBDA_CHAR}")
+            word = "" if word == LAMBDA_CHAR else word
+            # follow the longest prefix of word already in the DFA
+            path = [self.init_state]
+            for char in word:
+                next_state = path[-1].transitions.get(char)
+                if next_state is None:
+                    break
+                path.append(next_state)
+            prefix_len = len(path) - 1
+            if prefix_len == len(word) and path[-1] in finals:
+                continue
+
+            # states on the prefix will change, so take them out of the
+            # register; from the first confluence state on, change clones
+            for i in range(1, len(path)):
+                if incoming[path[i]] > 1:
+                    break
+                key = keys.pop(path[i], None)
+                if key is not None:
+                    del register[key]
+            else:
+                i = len(path)
+            for i in range(i, len(path)):
+                clone = DFA_State()
+                for char, dest in path[i].transitions.items():
+                    clone.add_transition(char, dest)
+                    incoming[dest] += 1
+                if path[i] in finals:
+                    finals.add(clone)
+                incoming[path[i]] -= 1
+                path[i - 1].add_transition(word[i - 1], clone)
+                incoming[clone] = 1
+                path[i] = clone
+
+            # add the rest of the word as a new chain of states
+            for char in word[prefix_len:]:
+                next_state = DFA_State()
+                path[-1].add_transition(char, next_state)
+                incoming[next_state] = 1
+                path.append(next_state)
+            finals.add(path[-1])
+
+            # replace each changed state by an equivalent registered one,
+            # or register it, working back towards the initial state
+            for i in range(len(path) - 1, 0, -1):
+                state = path[i]
+                key = (state in finals, tuple(sorted(state.transitions.items())))
+                equivalent = register.setdefault(key, state)
+                if equivalent is state:
+                    keys[state] = key
+                else:
+                    path[i - 1].add_transition(word[i - 1], equivalent)
+                    incoming[equivalent] += 1
+                    for dest in state.transitions.values():
+                        incoming[dest] -= 1
+                    del incoming[state]
+                    finals.discard(state)
+                    path[i] = equivalent
+            if METRICS.enabled:
+                METRICS.count("words_added")
+        self.label_states()
+
+    @timed("convert_from_NFA")
     def convert_from_NFA(self, nfa):
-        """Construct dfa from nfa"""
-        alphabet = nfa.get_alphabet()
+        """Construct dfa from nfa. Returns dict of frozenset of nfa states
+        -> dfa state."""
+        # symbols in the same class have the same transitions, so the
+        # subset reached is only computed for the first of each class
+        symbol_classes = nfa.get_symbol_classes()
         complete = {}
         pending = {}
         init_states = nfa.init_state.find_all_reachable(LAMBDA_CHAR)
@@ -644,29 +1284,34 @@ class DFA(FSA):
         pending[frozenset(init_states)] = self.init_state
         while pending:
             label, state = pending.popitem()
-            for char in alphabet:
-                reachable_states = set()
-                for nfa_state in label:
-                    reachable_states |= nfa_state.find_all_reachable(char)
+            for symbol_class in symbol_classes:
+                reachable_states = NFA_State.move(label, first_char(symbol_class[0]))
                 # freeze reachable_states to make it hashable
                 reachable_states = frozenset(reachable_states)
+                created = False
                 if label == reachable_states:
-                    state.add_transition(char, state)
+                    next_state = state
                 elif reachable_states in complete:
-                    state.add_transition(char, complete[reachable_states])
+                    next_state = complete[reachable_states]
                 elif reachable_states in pending:
-                    state.add_transition(char, pending[reachable_states])
+                    next_state = pending[reachable_states]
                 else:
                     new_label = '{}'
                     if reachable_states:
                         new_label = str(set(reachable_states))
-                    new_state = DFA_State(new_label)
-                    pending[reachable_states] = new_state
-                    state.add_transition(char, new_state)
+                    next_state = DFA_State(new_label)
+                    pending[reachable_states] = next_state
+                    created = True
+                if METRICS.enabled:
+                    METRICS.count("subset_states_created" if created
+                                  else "subset_cache_hits")
+                for char in symbol_class:
+                    state.add_transition(char, next_state)
             complete[label] = state
         
         self.final_states = {state for nfa_states, state in complete.items()
                              if nfa_states.intersection(nfa.final_states)}
+        return complete
         
     def test(self, s, trace=False):
         """Test if DFA accepts a string"""
@@ -678,53 +1323,145 @@ class DFA(FSA):
             print("-" * 80)
             print_trace(s, self.init_state)
 
+        if METRICS.enabled:
+            METRICS.count("dfa_tests")
         if s == LAMBDA_CHAR:
             return self.init_state in self.final_states
         
+        # stop as soon as no final state can be reached
+        live = self.cached_live_states()
         state = self.init_state
         for i, char in enumerate(s, 1):
-            state = state.transitions.get(char)
-            # return false if char not in DFA alphabet
-            if state == None:
+            state = state.transitions.get(char) or state.next(char)
+            # return false if char not in DFA alphabet or no final state
+            # can be reached from the new state
+            if state not in live:
+                if METRICS.enabled:
+                    METRICS.count("dfa_states_visited", i)
                 return False
             if trace:
                 print_trace(s[i:], state)
+        if METRICS.enabled:
+            METRICS.count("dfa_states_visited", len(s) + 1)
         accepted = state in self.final_states
         return accepted
     
     def to_regex(self):
         """Get equivalent regex"""
         return NFA(dfa=self).to_regex()
+
+    def get_alphabet(self):
+        """Get set of characters consumed in transitions"""
+        states = self.get_state_list()
+        return reduce(set.union, [set(s.transitions.keys()) for s in states], set())
+
+    def copy(self):
+        """Make an equivalent DFA with new copies of the reachable states"""
+        new_states = {s: DFA_State(s.label) for s in self.get_state_list()}
+        dfa = DFA()
+        for state, new_state in new_states.items():
+            for char, dest in state.transitions.items():
+                new_state.add_transition(char, new_states[dest])
+        dfa.init_state = new_states[self.init_state]
+        dfa.final_states = {new_states[s] for s in self.final_states
+                            if s in new_states}
+        return dfa
+
+    def get_init_states(self):
+        """Get set of states active before any input is read"""
+        return {self.init_state}
+
+    def sample(self, n, k=1, seed=None):
+        """Draw k strings of length n uniformly from the accepted strings"""
+        return self._sample(n, k, seed, accepted=True)
+
+    def sample_rejected(self, n, k=1, seed=None):
+        """Draw k strings of length n over the DFA alphabet uniformly from
+        the rejected strings"""
+        return self._sample(n, k, seed, accepted=False)
+
+    def _sample(self, n, k, seed, accepted):
+        """Sample strings by walking the DFA, weighting each transition by
+        the number of length n completions that end in the wanted outcome"""
+        alphabet = self.get_chars()
+        # None stands for the implicit dead state of missing transitions
+        states = self.get_state_list() + [None]
+        counts = {s: int((s in self.final_states) == accepted) for s in states}
+        # tables[i][state] holds cumulative counts for strings of length i
+        tables = [None]
+        for _ in range(n):
+            table = {}
+            for state in states:
+                next_states = [None if state is None else state.next(c)
+                               for c in alphabet]
+                cumulative = []
+                total = 0
+                for next_state in next_states:
+                    total += counts[next_state]
+                    cumulative.append(total)
+                table[state] = (cumulative, next_states)
+            counts = {s: table[s][0][-1] if alphabet else 0 for s in states}
+            tables.append(table)
+
+        if counts[self.init_state] == 0:
+            return []
+        rng = random.Random(seed)
+        samples = []
+        for _ in range(k):
+            state = self.init_state
+            chars = []
+            for i in range(n, 0, -1):
+                cumulative, next_states = tables[i][state]
+                index = bisect_right(cumulative, rng.randrange(cumulative[-1]))
+                chars.append(alphabet[index])
+                state = next_states[index]
+            samples.append("".join(chars))
+        return samples
+
+    def get_next_states(self, states, char):
+        """Get set of states reachable from states by consuming char"""
+        next_states = set()
+        for state in states:
+            next_state = state.next(char)
+            if next_state is not None:
+                next_states.add(next_state)
+        return next_states
     
+    @timed("reduce")
     def reduce(self):
         """Make equivalent DFA with minimal number of states"""
         
-        new_dfa = DFA()
-        alphabet = self.init_state.transitions.keys()
+        new_dfa = self.__class__()
+        # symbols in the same class never distinguish states
+        symbol_classes = self.get_symbol_classes()
+        alphabet = [first_char(symbol_class[0]) for symbol_class in symbol_classes]
         states = self.get_state_list()
+        # next states of each state, in alphabet order
+        rows = {s: [s.next(char) for char in alphabet] for s in states}
 
-        final_states = self.final_states.copy()
-        nonfinal_states = set(states) - final_states
-        state_eq_classes = {s: nonfinal_states for s in nonfinal_states}
-        for s in final_states:
-            state_eq_classes[s] = final_states
-
-        # filter to remove empty sets
-        equiv_classes = list(filter(None, [final_states, nonfinal_states]))
+        # initial partition: final and nonfinal states
+        partition = defaultdict(set)
+        for s in states:
+            partition[self.get_partition_key(s)].add(s)
+        equiv_classes = list(partition.values())
+        state_eq_classes = {s: eq_class for eq_class in equiv_classes
+                            for s in eq_class}
+        # missing transitions of partial DFAs
+        state_eq_classes[None] = None
 
         marked_new_pair = True
 
         def distinguishable(s1, s2):
             """test if states are distinguishable, given current partitions"""
-            for char in alphabet:
-                s1_next = s1.transitions[char]
-                s2_next = s2.transitions[char]
+            for s1_next, s2_next in zip(rows[s1], rows[s2]):
                 if state_eq_classes[s1_next] != state_eq_classes[s2_next]:
                     return True
             return False
 
         # continue until no new partitions are created
         while marked_new_pair:
+            if METRICS.enabled:
+                METRICS.count("reduce_refinement_rounds")
             new_equiv_classes = []
             for eq_class in equiv_classes:
                 if len(eq_class) == 1:
@@ -770,13 +1507,26 @@ class DFA(FSA):
 
             # pick an arbitrary member of the equivalence class
             old_state = next(iter(eq_set))
-            for char in alphabet:
-                old_next = old_state.transitions[char]
+            self.inherit_state_data(new_dfa, new_state, old_state)
+            for symbol_class, old_next in zip(symbol_classes, rows[old_state]):
+                if old_next is None:
+                    continue
                 next_state_set = frozenset(state_eq_classes[old_next])
-                new_state.add_transition(char, new_states_dict[next_state_set])
+                for char in symbol_class:
+                    new_state.add_transition(char, new_states_dict[next_state_set])
 
         return new_dfa
     
+    def get_partition_key(self, state):
+        """Key of the initial partition used by reduce. States with
+        different keys are never merged."""
+        return state in self.final_states
+
+    def inherit_state_data(self, new_dfa, new_state, old_state):
+        """Copy data of old_state to the reduced DFA's new_state. Does
+        nothing here; subclasses with per-state data override this."""
+        pass
+
     def get_state_list(self):
         """Get list of reachable states in DFS traversal order."""
         state_list = []
@@ -792,6 +1542,21 @@ class DFA(FSA):
                 state_list.append(state)
         return state_list
 
+    def transition_table(self):
+        """Flatten the transitions into a table indexed by symbol class
+        number. Returns (states, char_classes, rows): states is the state
+        list, char_classes a Symbol_Map from characters to class numbers,
+        and rows[i] the list of states reached from states[i] on each
+        class (None if there is no transition). Characters outside the
+        alphabet map to one more class, whose entries are all None."""
+        states = self.get_state_list()
+        symbol_classes = self.get_symbol_classes()
+        char_classes = Symbol_Map(symbol_classes, default=len(symbol_classes))
+        alphabet = [first_char(symbol_class[0]) for symbol_class in symbol_classes]
+        rows = [[state.next(char) for char in alphabet] + [None]
+                for state in states]
+        return states, char_classes, rows
+
     def __repr__(self):
         s = f"if {'Label':15}{'Transitions'}\n{"-"*70}\n"
         for state in self.get_state_list():
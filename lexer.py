@@ -0,0 +1,148 @@
+#! /usr/bin/python3
+
+"""Maximal munch tokenizer built on a tagged multi-pattern DFA"""
+
+from collections import namedtuple
+from multi_dfa import Multi_DFA
+
+DEFAULT_CHUNK_SIZE = 1 << 20
+# failed scan pairs at positions before the current token are dropped
+# whenever their number doubles, but not while there are fewer than this
+MIN_FAILED_PRUNE = 1 << 12
+
+Token = namedtuple("Token", ["name", "value", "position"])
+
+class Lex_Error(Exception):
+    pass
+
+class Lexer:
+    """Split text into tokens. Rules are an ordered list of (token name,
+    regex) pairs. At each position the longest match wins; among rules
+    matching the same longest string, the earliest rule wins."""
+    def __init__(self, rules):
+        self.names = [name for name, _ in rules]
+        dfa = Multi_DFA([regex for _, regex in rules]).reduce()
+
+        # flatten the DFA into lists indexed by state and symbol class
+        # number, with None for transitions to dead states so the scan
+        # stops as soon as no longer token is possible
+        states, self.char_classes, rows = dfa.transition_table()
+        ids = {state: i for i, state in enumerate(states)}
+        live = dfa.get_live_states()
+        self.init = ids[dfa.init_state]
+        self.transitions = [[ids[dest] if dest in live else None
+                             for dest in row]
+                            for row in rows]
+        self.accept = [min(dfa.tags[state], default=None) for state in states]
+        if self.accept[self.init] is not None:
+            name = self.names[self.accept[self.init]]
+            raise Lex_Error(f"rule {name} matches the empty string")
+
+    def _advance(self, text, i, base, state, rule, end, passed, failed):
+        """Continue a scan in state over text from index i, where base is
+        the input position of text[0]. rule (None if there is none) and end
+        are the rule id and input end position of the longest token found
+        so far, and passed is the list of (state, position) pairs passed
+        since then. Returns the new (state, rule, end, passed); state is
+        None if the scan stopped before the end of text because no longer
+        token is possible.
+
+        A scan that stops adds the pairs it passed after its longest token
+        to failed, since no token ends after them, and later scans that
+        reach a failed pair stop there. Each pair can only be passed once
+        more, so tokenizing is linear in the length of the text."""
+        transitions, accept = self.transitions, self.accept
+        char_classes = self.char_classes
+        n = len(text)
+        while i < n:
+            state = transitions[state][char_classes[text[i]]]
+            i += 1
+            if state is None or failed and (state, base + i) in failed:
+                failed.update(passed)
+                return None, rule, end, passed
+            if accept[state] is not None:
+                rule = accept[state]
+                end = base + i
+                if passed:
+                    passed = []
+            else:
+                passed.append((state, base + i))
+        return state, rule, end, passed
+
+    def tokenize(self, text, skip=()):
+        """Generate the tokens of a string, leaving out token names in skip"""
+        return self.tokenize_chunks((text,), skip)
+
+    def tokenize_chunks(self, chunks, skip=()):
+        """Generate tokens from an iterable of string chunks. Tokens may
+        span chunk boundaries: the scan of a token that reaches the end of
+        a chunk is continued on the next one, and the chunks it covers are
+        only joined once the token is complete."""
+        names, init, advance = self.names, self.init, self._advance
+        # text from the start of the pending token, and its input position
+        buffer = ""
+        offset = 0
+        # whether the scan of the pending token reached the end of the text
+        # read so far, and the chunks read since then
+        pending = False
+        spill = []
+        spill_length = 0
+        failed = set()
+        prune_size = MIN_FAILED_PRUNE
+        chunks = iter(chunks)
+        final = False
+        while not final:
+            chunk = next(chunks, None)
+            final = chunk is None
+            if pending:
+                if not final:
+                    base = offset + len(buffer) + spill_length
+                    state, rule, end, passed = advance(chunk, 0, base, state, rule,
+                                                       end, passed, failed)
+                    spill.append(chunk)
+                    spill_length += len(chunk)
+                    if state is not None:
+                        continue
+                else:
+                    # no token ends after the end of the text either
+                    failed.update(passed)
+                buffer = "".join([buffer] + spill)
+                spill = []
+                spill_length = 0
+            elif not final:
+                buffer = chunk
+                # scans never go back before the start of the chunk
+                failed.clear()
+
+            pos = 0
+            length = len(buffer)
+            while pos < length:
+                if not pending:
+                    if len(failed) > prune_size:
+                        # scans only reach positions after their start
+                        start = offset + pos
+                        failed = {pair for pair in failed if pair[1] > start}
+                        prune_size = max(2 * len(failed), MIN_FAILED_PRUNE)
+                    state, rule, end, passed = advance(buffer, pos, offset, init, None,
+                                                       offset + pos, [], failed)
+                    if state is not None:
+                        if not final:
+                            pending = True
+                            break
+                        failed.update(passed)
+                pending = False
+                if rule is None:
+                    raise Lex_Error(f"no token matches at position {offset + pos}")
+                name = names[rule]
+                if name not in skip:
+                    yield Token(name, buffer[pos:end - offset], offset + pos)
+                pos = end - offset
+            buffer = buffer[pos:]
+            offset += pos
+
+    def tokenize_file(self, filename, skip=(), encoding="utf-8",
+                      chunk_size=DEFAULT_CHUNK_SIZE):
+        """Generate the tokens of a text file, read in large chunks"""
+        with open(filename, "r", encoding=encoding) as file:
+            chunks = iter(lambda: file.read(chunk_size), "")
+            yield from self.tokenize_chunks(chunks, skip)
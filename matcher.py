@@ -0,0 +1,126 @@
+#! /usr/bin/python3
+
+"""Resumable matchers for input that arrives in chunks"""
+
+import codecs
+from fsa import DFA
+
+STREAM_CHUNK_SIZE = 1 << 16
+
+class Matcher:
+    """Base class for matchers that keep their state between feed() calls"""
+    def reset(self):
+        """Start matching a new string"""
+        self.position = 0
+        self._reset()
+        # number of characters read when rejection became certain, or
+        # None while the input can still be accepted
+        self.reject_position = 0 if self.dead() else None
+
+    def feed(self, chunk):
+        """Consume the next chunk of the input string"""
+        if not self.dead():
+            num_read = self._feed(chunk)
+            if self.dead():
+                self.reject_position = self.position + num_read
+        self.position += len(chunk)
+
+    async def feed_stream(self, reader, encoding="utf-8",
+                          chunk_size=STREAM_CHUNK_SIZE):
+        """Feed everything read from an asyncio.StreamReader and return
+        whether the input was accepted. Reading stops early once the
+        matcher is dead."""
+        decoder = codecs.getincrementaldecoder(encoding)()
+        while not self.dead():
+            data = await reader.read(chunk_size)
+            if not data:
+                self.feed(decoder.decode(b"", final=True))
+                break
+            self.feed(decoder.decode(data))
+        return self.accepting()
+
+class DFA_Matcher(Matcher):
+    """Matcher holding the current DFA state"""
+    def __init__(self, dfa):
+        self.final_states = dfa.final_states
+        self.init_state = dfa.init_state
+        # transitions are lists indexed by symbol class number, with None
+        # for states that cannot reach a final state, so the current state
+        # becomes None as soon as rejection is certain
+        live = dfa.cached_live_states()
+        states, self.char_classes, rows = dfa.transition_table()
+        self.transitions = {state: [dest if dest in live else None
+                                    for dest in row]
+                            for state, row in zip(states, rows)}
+        if self.init_state not in live:
+            self.init_state = None
+        self.reset()
+
+    def _reset(self):
+        self.state = self.init_state
+
+    def _feed(self, chunk):
+        """Returns the number of characters read"""
+        state = self.state
+        transitions, char_classes = self.transitions, self.char_classes
+        for i, char in enumerate(chunk, 1):
+            state = transitions[state][char_classes[char]]
+            if state is None:
+                self.state = None
+                return i
+        self.state = state
+        return len(chunk)
+
+    def accepting(self):
+        return self.state in self.final_states
+
+    def dead(self):
+        return self.state is None
+
+class NFA_Matcher(Matcher):
+    """Matcher holding the set of current NFA states"""
+    def __init__(self, nfa):
+        self.nfa = nfa
+        self.live = nfa.cached_live_states()
+        self.init_states = frozenset(nfa.get_init_states() & self.live)
+        self.reset()
+
+    def _reset(self):
+        self.states = self.init_states
+
+    def _feed(self, chunk):
+        """Returns the number of characters read"""
+        states = self.states
+        for i, char in enumerate(chunk, 1):
+            states = self.nfa.get_next_states(states, char) & self.live
+            if not states:
+                self.states = states
+                return i
+        self.states = states
+        return len(chunk)
+
+    def accepting(self):
+        return not self.states.isdisjoint(self.nfa.final_states)
+
+    def dead(self):
+        return len(self.states) == 0
+
+class Reverse_Matcher(DFA_Matcher):
+    """Matcher that reads the input from right to left, using the DFA of
+    the reversed automaton. Patterns such as (a|b)*a(a|b){n} have DFAs
+    with 2^n states but small reversed DFAs. Chunks must be fed last
+    first, each in its normal order, and reject_position counts the
+    characters read from the end."""
+    def __init__(self, fsa):
+        super().__init__(DFA(nfa=fsa.reverse()).reduce())
+
+    def _feed(self, chunk):
+        return super()._feed(chunk[::-1])
+
+def make_matcher(fsa, reverse=False):
+    """Make a matcher for a DFA or NFA, reading right to left if reverse"""
+    if reverse:
+        return Reverse_Matcher(fsa)
+    if isinstance(fsa, DFA):
+        return DFA_Matcher(fsa)
+    return NFA_Matcher(fsa)
@@ -0,0 +1,92 @@
+#! /usr/bin/python3
+
+"""Process-wide LRU memoization of regex compilation stages.
+
+compile_regex(regex, stage) returns the parse tree, NFA, DFA or minimal
+DFA of a regex, building each stage from the memoized previous stage.
+Automata are shared between callers, so they are frozen: methods that
+would modify them raise FSA_Error, and operations that reuse the states
+of their operands copy them first. Call copy() on an automaton to get a
+private, modifiable one. Parse trees are modified by simplify and
+condense, so each caller gets its own copy of the memoized tree.
+"""
+
+from collections import OrderedDict
+from threading import Lock
+import regex
+from fsa import NFA, DFA
+
+STAGES = ("parse", "nfa", "dfa", "min_dfa")
+DEFAULT_MAX_SIZE = 512
+
+class LRU_Cache:
+    """Bounded mapping that discards the least recently used entry"""
+    def __init__(self, max_size=DEFAULT_MAX_SIZE):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Get the value for key, or None"""
+        with self.lock:
+            value = self.entries.get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.entries.move_to_end(key)
+                self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def info(self):
+        return {"hits": self.hits, "misses": self.misses,
+                "size": len(self.entries), "max_size": self.max_size}
+
+    def __len__(self):
+        return len(self.entries)
+
+COMPILED = LRU_Cache()
+
+def compile_regex(regex_str, stage="min_dfa"):
+    """Get the memoized result of compiling regex_str to stage"""
+    if stage not in STAGES:
+        raise ValueError(f"unknown stage {stage!r}")
+    result = _compile(regex_str, stage)
+    if stage == "parse":
+        return regex.copy_tree(result)
+    return result
+
+def _compile(regex_str, stage):
+    """Get the shared result of compiling regex_str to stage"""
+    key = (regex_str, stage)
+    result = COMPILED.get(key)
+    if result is None:
+        result = _build(regex_str, stage)
+        COMPILED.put(key, result)
+    return result
+
+def _build(regex_str, stage):
+    if stage == "parse":
+        return regex.parse(regex_str)
+    if stage == "nfa":
+        fsa = NFA(node=_compile(regex_str, "parse"))
+    elif stage == "dfa":
+        fsa = DFA(nfa=_compile(regex_str, "nfa").reduce())
+    else:
+        fsa = _compile(regex_str, "dfa").reduce()
+    fsa.freeze()
+    return fsa
@@ -0,0 +1,70 @@
+#! /usr/bin/python3
+
+"""Opt-in engine counters and per-phase timers for fsa.py and regex.py.
+
+Instrumented code checks METRICS.enabled before recording anything, so
+leaving metrics disabled costs one attribute lookup per site.
+
+    from metrics import METRICS
+    METRICS.enabled = True
+    ...
+    print(METRICS.snapshot())
+"""
+
+from collections import defaultdict
+from functools import wraps
+from time import perf_counter
+
+class Metrics:
+    """Named counters and wall-clock phase timers"""
+    def __init__(self):
+        self.enabled = False
+        self.reset()
+
+    def reset(self):
+        """Clear all counters and timers"""
+        self.counters = defaultdict(int)
+        self.times = defaultdict(float)
+        self.calls = defaultdict(int)
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+
+    def add_time(self, phase, seconds):
+        self.times[phase] += seconds
+        self.calls[phase] += 1
+
+    def snapshot(self):
+        """Get a copy of the current counters and timers"""
+        return {
+            "counters": dict(self.counters),
+            "timers": {phase: {"calls": self.calls[phase], "seconds": seconds}
+                       for phase, seconds in self.times.items()},
+        }
+
+    def __str__(self):
+        s = f"Metrics {'enabled' if self.enabled else 'disabled'}\n"
+        s += f"{'Counter':30}{'Value':>12}\n{'-' * 42}\n"
+        for name, value in sorted(self.counters.items()):
+            s += f"{name:30}{value:>12}\n"
+        s += f"\n{'Phase':30}{'Calls':>12}{'Seconds':>14}\n{'-' * 56}\n"
+        for phase, seconds in sorted(self.times.items()):
+            s += f"{phase:30}{self.calls[phase]:>12}{seconds:>14.6f}\n"
+        return s
+
+METRICS = Metrics()
+
+def timed(phase):
+    """Decorator recording the wall-clock time of each call under phase"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not METRICS.enabled:
+                return func(*args, **kwargs)
+            start = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                METRICS.add_time(phase, perf_counter() - start)
+        return wrapper
+    return decorator
@@ -0,0 +1,55 @@
+#! /usr/bin/python3
+
+"""Combined DFA reporting which of several regexes match a string"""
+
+from fsa import NFA, NFA_State, DFA, LAMBDA_CHAR
+
+class Multi_DFA(DFA):
+    """DFA for a list of regexes. Each state is tagged with the frozenset
+    of ids (list indices) of the patterns accepting the strings that end
+    in it, so one pass over the input finds every matching pattern."""
+    def __init__(self, regexes=None):
+        super().__init__()
+        self.patterns = []
+        self.tags = {}
+        if regexes is not None:
+            self.compile(regexes)
+
+    def compile(self, regexes):
+        """Build the union NFA with tagged final states and determinize it"""
+        self.patterns = list(regexes)
+        union = NFA()
+        union.init_state = NFA_State("Init")
+        state_tags = {}
+        for pattern_id, regex in enumerate(self.patterns):
+            nfa = NFA(regex=regex)
+            union.init_state.add_transition(LAMBDA_CHAR, nfa.init_state)
+            for state in nfa.final_states:
+                state_tags[state] = pattern_id
+            union.final_states |= nfa.final_states
+
+        subsets = self.convert_from_NFA(union)
+        for nfa_states, state in subsets.items():
+            self.tags[state] = frozenset(state_tags[s] for s in nfa_states
+                                         if s in state_tags)
+
+    def get_partition_key(self, state):
+        return self.tags[state]
+
+    def inherit_state_data(self, new_dfa, new_state, old_state):
+        new_dfa.patterns = self.patterns
+        new_dfa.tags[new_state] = self.tags[old_state]
+
+    def match(self, s):
+        """Get frozenset of ids of the patterns that accept s"""
+        s = "" if s == LAMBDA_CHAR else s
+        state = self.init_state
+        for char in s:
+            state = state.next(char)
+            if state is None:
+                return frozenset()
+        return self.tags[state]
+
+    def match_patterns(self, s):
+        """Get list of the patterns that accept s, in pattern order"""
+        return [self.patterns[i] for i in sorted(self.match(s))]
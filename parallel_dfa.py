@@ -0,0 +1,150 @@
+#! /usr/bin/python3
+
+"""Parallel subset construction over the BFS frontier.
+
+The DFA is built level by level: all subsets discovered in one level are
+expanded together, split into chunks that a process pool expands in
+parallel. Workers only compute successor subsets; the parent process
+owns the index of subsets, numbers the new ones and collects the next
+frontier, so the result is the same DFA that sequential subset
+construction builds (Compact_NFA.to_dfa), up to state numbering.
+
+Workers expand subsets over a Bitset_NFA, where a set of NFA states is
+an int with one bit per state. Bitsets hash quickly and are cheap to send
+between processes, which matters because every subset crosses a process
+boundary twice.
+
+    dfa = parallel_determinize(NFA(regex="(a|b)*a(a|b){12}"), workers=4)
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from compact_nfa import Compact_NFA, subset_label
+from fsa import DFA, DFA_State
+from metrics import METRICS, timed
+
+# frontiers smaller than this are expanded in the parent process, since
+# sending them to workers costs more than it saves
+MIN_PARALLEL_FRONTIER = 256
+# number of chunks per worker in each level, for load balancing
+CHUNKS_PER_WORKER = 4
+
+class Bitset_NFA:
+    """NFA over sets of states represented as int bitsets. For each state,
+    moves[i] maps each symbol number to the lambda-closed bitset of the
+    states reached on it. Since closure distributes over union, the
+    successor of a subset on a symbol is the union of its states' moves."""
+    def __init__(self, compact):
+        self.num_symbols = len(compact.symbols)
+        closures = [self.to_bits(compact.closure((i,)))
+                    for i in range(compact.num_states)]
+        self.init = self.to_bits(compact.get_init_states())
+        self.final = self.to_bits(i for i in range(compact.num_states)
+                                  if compact.is_final(i))
+        self.moves = []
+        for i in range(compact.num_states):
+            moves = {}
+            for k in range(compact.offsets[i], compact.offsets[i + 1]):
+                symbol = compact.edge_symbols[k]
+                moves[symbol] = moves.get(symbol, 0) | closures[compact.edge_targets[k]]
+            self.moves.append(moves)
+
+    @staticmethod
+    def to_bits(states):
+        bits = 0
+        for i in states:
+            bits |= 1 << i
+        return bits
+
+    @staticmethod
+    def from_bits(bits):
+        """Get list of the state numbers in a bitset"""
+        states = []
+        while bits:
+            low = bits & -bits
+            states.append(low.bit_length() - 1)
+            bits ^= low
+        return states
+
+    def successors(self, bits):
+        """Get list of the successor bitsets of a subset, one per symbol"""
+        row = [0] * self.num_symbols
+        moves = self.moves
+        while bits:
+            low = bits & -bits
+            for symbol, dest_bits in moves[low.bit_length() - 1].items():
+                row[symbol] |= dest_bits
+            bits ^= low
+        return row
+
+# NFA of each worker process, set by init_worker
+worker_nfa = None
+
+def init_worker(compact_bytes):
+    global worker_nfa
+    worker_nfa = Bitset_NFA(Compact_NFA.from_bytes(compact_bytes))
+
+def expand_chunk(subsets):
+    """Get the successor rows of a list of subsets, in a worker"""
+    return [worker_nfa.successors(bits) for bits in subsets]
+
+def split(items, num_chunks):
+    """Split a list into at most num_chunks lists of nearly equal size"""
+    size = -(-len(items) // num_chunks)
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+@timed("parallel_determinize")
+def parallel_determinize(nfa, workers=None):
+    """Construct a DFA equivalent to nfa (an NFA or Compact_NFA) by
+    expanding each BFS level of subsets in a pool of worker processes.
+    workers defaults to the number of CPUs; with one worker, no processes
+    are started."""
+    compact = nfa if isinstance(nfa, Compact_NFA) else Compact_NFA(nfa)
+    bitset_nfa = Bitset_NFA(compact)
+    workers = workers or os.cpu_count() or 1
+
+    # subset bitset -> state number, and transition rows by state number
+    index = {bitset_nfa.init: 0}
+    subsets = [bitset_nfa.init]
+    rows = []
+    pool = None
+    if workers > 1:
+        pool = ProcessPoolExecutor(workers, initializer=init_worker,
+                                   initargs=(compact.to_bytes(),))
+    try:
+        frontier = [bitset_nfa.init]
+        while frontier:
+            if METRICS.enabled:
+                METRICS.count("parallel_levels")
+            if pool is None or len(frontier) < MIN_PARALLEL_FRONTIER:
+                level_rows = [bitset_nfa.successors(bits) for bits in frontier]
+            else:
+                chunks = split(frontier, workers * CHUNKS_PER_WORKER)
+                level_rows = [row for chunk_rows in pool.map(expand_chunk, chunks)
+                              for row in chunk_rows]
+            # number the new subsets in order, so the numbering does not
+            # depend on how the level was split
+            frontier = []
+            for row in level_rows:
+                for i, bits in enumerate(row):
+                    state = index.get(bits)
+                    if state is None:
+                        state = index[bits] = len(subsets)
+                        subsets.append(bits)
+                        frontier.append(bits)
+                    row[i] = state
+                rows.append(row)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    dfa = DFA()
+    states = [DFA_State(subset_label(Bitset_NFA.from_bits(bits)))
+              for bits in subsets]
+    for state, row, bits in zip(states, rows, subsets):
+        for char, dest in zip(compact.symbols, row):
+            state.add_transition(char, states[dest])
+        if bits & bitset_nfa.final:
+            dfa.final_states.add(state)
+    dfa.init_state = states[0]
+    return dfa
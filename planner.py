@@ -0,0 +1,234 @@
+#! /usr/bin/python3
+
+"""Automatic choice of the engine used to test strings.
+
+A Planner inspects an automaton once and picks one of four engines:
+
+    dfa        full DFA, built up front; one table lookup per character
+    lazy_dfa   DFA states built as the input reaches them, in a bounded
+               cache that is flushed when full
+    nfa        set simulation (NFA.test); no setup, cost per character
+               proportional to the number of NFA states
+    backtrack  depth-first search over NFA paths; no setup or memory, but
+               exponential in the worst case
+
+The estimate behind the choice includes the state count, the share of
+lambda transitions, the alphabet size, the largest number of transitions
+on one symbol from a state, and a sampled subset construction that stops
+after SAMPLE_STATES subsets. If the sample finishes, the whole DFA is
+small and is built. A lambda-free NFA with at most one transition per
+state and symbol is already deterministic, so backtracking never
+backtracks and needs no setup. Everything else uses the lazy DFA.
+
+The lazy DFA and backtracking run under budgets: too many cache flushes
+in one test, or too many backtracking steps per character, switch the
+planner to set simulation for the rest of its life. Each character then
+costs at most a bounded amount of work, whatever the pattern.
+"""
+
+from compact_nfa import Compact_NFA
+from fsa import NFA, DFA, LAMBDA_CHAR
+from metrics import METRICS
+
+ENGINES = ("dfa", "lazy_dfa", "nfa", "backtrack")
+# subsets explored when estimating the DFA size
+SAMPLE_STATES = 512
+# states cached by a lazy DFA before it is flushed
+LAZY_DFA_STATES = 10000
+# flushes allowed in one test before falling back to set simulation
+LAZY_DFA_FLUSHES = 4
+# backtracking steps allowed per input character
+BACKTRACK_STEPS_PER_CHAR = 4
+
+class Budget_Exceeded(Exception):
+    pass
+
+def estimate_cost(compact, sample_states=SAMPLE_STATES):
+    """Get dict of the cost factors of a Compact_NFA. dfa_states is the
+    number of DFA states if the sampled subset construction finished,
+    otherwise None, and growth is the number of subsets discovered per
+    subset expanded in the sample."""
+    num_edges = len(compact.edge_targets)
+    num_lambdas = len(compact.lambda_targets)
+    # most targets on one symbol from one state; edges are sorted by symbol
+    branching = 0
+    for i in range(compact.num_states):
+        symbols = compact.edge_symbols[compact.offsets[i]:compact.offsets[i + 1]]
+        run = 0
+        for k, symbol in enumerate(symbols):
+            run = run + 1 if k > 0 and symbol == symbols[k - 1] else 1
+            branching = max(branching, run)
+
+    init = compact.get_init_states()
+    discovered = {init}
+    to_visit = [init]
+    expanded = 0
+    while to_visit and len(discovered) <= sample_states:
+        subset = to_visit.pop(0)
+        moves = compact.successors(subset)
+        for targets in moves.values():
+            next_subset = compact.closure(targets)
+            if next_subset not in discovered:
+                discovered.add(next_subset)
+                to_visit.append(next_subset)
+        expanded += 1
+    return {
+        "nfa_states": compact.num_states,
+        "lambda_density": num_lambdas / max(num_edges + num_lambdas, 1),
+        "alphabet_size": len(compact.symbols),
+        "branching": branching,
+        "dfa_states": None if to_visit else len(discovered),
+        "growth": len(discovered) / max(expanded, 1),
+    }
+
+def choose_engine(estimate):
+    """Get (engine, reason) for an estimate made by estimate_cost"""
+    if estimate["dfa_states"] is not None:
+        return "dfa", f"DFA has at most {estimate['dfa_states']} states"
+    if estimate["lambda_density"] == 0 and estimate["branching"] <= 1:
+        return "backtrack", "NFA is already deterministic"
+    return "lazy_dfa", (f"DFA exceeds {SAMPLE_STATES} states "
+                        f"(growth {estimate['growth']:.2f} per state)")
+
+class Lazy_DFA:
+    """DFA whose states are subsets of Compact_NFA states, built when the
+    input first reaches them and kept in a cache of at most max_states
+    states. A full cache is cleared. test raises Budget_Exceeded if the
+    cache is cleared more than max_flushes times while testing one
+    string, which means the input visits too many distinct states for a
+    cache to help."""
+    def __init__(self, compact, max_states=LAZY_DFA_STATES,
+                 max_flushes=LAZY_DFA_FLUSHES):
+        self.compact = compact
+        self.max_states = max_states
+        self.max_flushes = max_flushes
+        self.flush()
+
+    def flush(self):
+        """Clear the cache of states"""
+        self.ids = {}
+        self.subsets = []
+        # transitions of each state, as dicts of symbol number -> state
+        self.rows = []
+        self.final = []
+        self.init = self.get_id(self.compact.get_init_states())
+
+    def get_id(self, subset):
+        state = self.ids.get(subset)
+        if state is None:
+            state = self.ids[subset] = len(self.subsets)
+            self.subsets.append(subset)
+            self.rows.append({})
+            self.final.append(self.compact.any_final(subset))
+            if METRICS.enabled:
+                METRICS.count("lazy_dfa_states")
+        return state
+
+    def test(self, s):
+        s = "" if s == LAMBDA_CHAR else s
+        symbol_ids, rows = self.compact.symbol_ids, self.rows
+        flushes = 0
+        state = self.init
+        for char in s:
+            symbol = symbol_ids[char]
+            if symbol is None:
+                return False
+            next_state = rows[state].get(symbol)
+            if next_state is None:
+                subset = self.compact.step(self.subsets[state], char)
+                if not subset:
+                    return False
+                if len(self.subsets) >= self.max_states:
+                    flushes += 1
+                    if METRICS.enabled:
+                        METRICS.count("lazy_dfa_flushes")
+                    if flushes > self.max_flushes:
+                        raise Budget_Exceeded("lazy DFA cache flushed too often")
+                    self.flush()
+                    rows = self.rows
+                    next_state = self.get_id(subset)
+                else:
+                    next_state = self.get_id(subset)
+                    rows[state][symbol] = next_state
+            state = next_state
+        return self.final[state]
+
+def backtrack_test(compact, s, max_steps):
+    """Test s by depth-first search over the paths of a Compact_NFA.
+    Raises Budget_Exceeded after max_steps steps."""
+    s = "" if s == LAMBDA_CHAR else s
+    offsets, symbols, targets = compact.offsets, compact.edge_symbols, compact.edge_targets
+    stack = [(compact.init_state, 0)]
+    steps = 0
+    while stack:
+        steps += 1
+        if steps > max_steps:
+            raise Budget_Exceeded("backtracking took too many steps")
+        state, i = stack.pop()
+        if i == len(s) and compact.is_final(state):
+            return True
+        for k in range(compact.lambda_offsets[state], compact.lambda_offsets[state + 1]):
+            stack.append((compact.lambda_targets[k], i))
+        if i < len(s):
+            symbol = compact.symbol_ids[s[i]]
+            for k in range(offsets[state], offsets[state + 1]):
+                if symbols[k] == symbol:
+                    stack.append((targets[k], i + 1))
+    return False
+
+class Planner:
+    """Tests strings with the engine chosen for an automaton, or with
+    engine if one is given"""
+    def __init__(self, fsa, engine=None):
+        if engine is not None and engine not in ENGINES:
+            raise ValueError(f"unknown engine {engine!r}")
+        self.fsa = fsa
+        self.compact = None
+        if isinstance(fsa, DFA):
+            self.estimate = {"dfa_states": len(fsa.get_state_list())}
+            self.engine, self.reason = "dfa", "automaton is a DFA"
+        else:
+            self.estimate = estimate_cost(self.get_compact())
+            self.engine, self.reason = choose_engine(self.estimate)
+        if engine is not None:
+            self.engine, self.reason = engine, "chosen by user"
+        # DFA or Lazy_DFA of the current engine, built on first use
+        self.matcher = None
+
+    def get_compact(self):
+        if self.compact is None:
+            nfa = NFA(dfa=self.fsa) if isinstance(self.fsa, DFA) else self.fsa
+            self.compact = Compact_NFA(nfa)
+        return self.compact
+
+    def switch(self, engine, reason):
+        """Use engine from now on"""
+        if METRICS.enabled:
+            METRICS.count("planner_fallbacks")
+        self.engine, self.reason = engine, reason
+        self.matcher = None
+
+    def test(self, s):
+        """Test if the automaton accepts s"""
+        try:
+            return self.run(s)
+        except Budget_Exceeded as e:
+            self.switch("nfa", f"fell back from {self.engine}: {e}")
+            return self.run(s)
+
+    def run(self, s):
+        engine = self.engine
+        if engine == "nfa" or (engine == "dfa" and isinstance(self.fsa, DFA)):
+            return self.fsa.test(s)
+        if engine == "backtrack":
+            max_steps = BACKTRACK_STEPS_PER_CHAR * (len(s) + 1)
+            return backtrack_test(self.get_compact(), s, max_steps)
+        if self.matcher is None:
+            if engine == "dfa":
+                self.matcher = self.get_compact().to_dfa()
+            else:
+                self.matcher = Lazy_DFA(self.get_compact())
+        return self.matcher.test(s)
+
+    def describe(self):
+        return f"{self.engine} ({self.reason})"
@@ -2,7 +2,7 @@
 
 import random
 from regex import *
-from fsa import NFA
+from fsa import NFA, DFA, LAMBDA_CHAR
 import string
 import unittest
 
@@ -113,6 +113,60 @@ class Test_Random_Regex(unittest.TestCase):
             for s in test_case.rejected:
                 self.assertFalse(nfa.test(s), msg + s)
 
+    def test_enumerate(self):
+        case_generator = Regex_Case_Generator(ALPHABET_SIZE, MAX_LENGTH)
+        for _ in range(NUM_TESTS):
+            test_case = case_generator.generate()
+            print("Enumerating " + test_case.regex)
+            nfa = NFA(node=test_case.tree)
+            shortlex = sorted(test_case.accepted, key=lambda s: (len(s), s))
+            self.assertEqual(list(nfa.enumerate(MAX_LENGTH)), shortlex)
+            self.assertEqual(list(DFA(nfa=nfa).enumerate(MAX_LENGTH)), shortlex)
+
+    def test_remove_lambdas(self):
+        case_generator = Regex_Case_Generator(ALPHABET_SIZE, MAX_LENGTH)
+        for _ in range(NUM_TESTS):
+            test_case = case_generator.generate()
+            print("Removing lambdas from " + test_case.regex)
+            nfa = NFA(node=test_case.tree).remove_lambdas()
+            for state in nfa.get_state_list():
+                self.assertNotIn(LAMBDA_CHAR, state.outgoing)
+            for s in test_case.accepted:
+                self.assertTrue(nfa.test(s), test_case.regex + " rejected " + s)
+            for s in test_case.rejected:
+                self.assertFalse(nfa.test(s), test_case.regex + " accepted " + s)
+
+    def test_nfa_reduce(self):
+        case_generator = Regex_Case_Generator(ALPHABET_SIZE, MAX_LENGTH)
+        for _ in range(NUM_TESTS):
+            test_case = case_generator.generate()
+            print("Reducing " + test_case.regex)
+            nfa = NFA(node=test_case.tree)
+            reduced = nfa.reduce()
+            self.assertLessEqual(len(reduced.get_state_list()),
+                                 len(nfa.get_state_list()))
+            for s in test_case.accepted:
+                self.assertTrue(reduced.test(s), test_case.regex + " rejected " + s)
+            for s in test_case.rejected:
+                self.assertFalse(reduced.test(s), test_case.regex + " accepted " + s)
+
+    def test_brzozowski(self):
+        case_generator = Regex_Case_Generator(ALPHABET_SIZE, MAX_LENGTH)
+        for _ in range(NUM_TESTS):
+            test_case = case_generator.generate()
+            print("Reversing " + test_case.regex)
+            nfa = NFA(node=test_case.tree)
+            reversed_nfa = nfa.reverse()
+            minimal = nfa.brzozowski()
+            self.assertEqual(len(minimal.get_state_list()),
+                             len(DFA(nfa=nfa).reduce().get_state_list()))
+            for s in test_case.accepted:
+                self.assertTrue(minimal.test(s), test_case.regex + " rejected " + s)
+                self.assertTrue(reversed_nfa.test(s[::-1] or LAMBDA_CHAR), s)
+            for s in test_case.rejected:
+                self.assertFalse(minimal.test(s), test_case.regex + " accepted " + s)
+                self.assertFalse(reversed_nfa.test(s[::-1] or LAMBDA_CHAR), s)
+
 if __name__ == "__main__":
     unittest.main()
     # g = Regex_Case_Generator(4, 6)
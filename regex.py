@@ -1,11 +1,17 @@
 #! /usr/bin/python3
 
 import string
-from functools import reduce
+import sys
+from bisect import bisect_left, bisect_right
+from functools import reduce, lru_cache
+from metrics import timed
 
 # special regex characters
 NULL_CHAR = "~"
 LAMBDA_CHAR = "^"
+CLASS_OPEN = "["
+CLASS_CLOSE = "]"
+RANGE_CHAR = "-"
 
 class Char_Buffer:
     """Character buffer for reading characters one at a time from a string"""
@@ -41,7 +47,18 @@ class Operator:
 UNION_SYM = "|"
 CAT_SYM = "."
 STAR_SYM = "*"
+PLUS_SYM = "+"
+OPTIONAL_SYM = "?"
+REPEAT_OPEN = "{"
+REPEAT_CLOSE = "}"
 OPERATOR_SYM = UNION_SYM, CAT_SYM, STAR_SYM
+# postfix operators with the same precedence as star
+REPEAT_SYM = PLUS_SYM, OPTIONAL_SYM, REPEAT_OPEN
+# characters that can only be matched literally inside a character class
+SPECIAL_CHARS = set(OPERATOR_SYM + REPEAT_SYM) | {
+    NULL_CHAR, LAMBDA_CHAR, CLASS_OPEN, CLASS_CLOSE, REPEAT_CLOSE, "(", ")"}
+# characters that are read specially at the ends of class intervals
+CLASS_ESCAPES = CLASS_CLOSE, RANGE_CHAR, LAMBDA_CHAR
 
 # Regex operators 
 UNION = Operator(UNION_SYM, 1)
@@ -64,6 +81,19 @@ class Character_Node(Leaf_Node):
     def __repr__(self):
         return self.char
 
+    def regex(self):
+        # special characters are written as one-character classes
+        if self.char in SPECIAL_CHARS:
+            return class_label(((self.char, self.char),))
+        return self.char
+
+class Class_Node(Character_Node):
+    """Character class such as [a-z0-9]. Its char is the class label, which
+    is also used as the transition label in automata."""
+    def __init__(self, label):
+        super().__init__(label)
+        self.intervals = class_intervals(label)
+
 class Lambda_Node(Leaf_Node):
     char = LAMBDA_CHAR
 
@@ -88,6 +118,32 @@ class Star_Node(Regex_Node):
             return "({})".format(self.child.regex()) + STAR_SYM
         return self.child.regex() + STAR_SYM
     
+class Repeat_Node(Regex_Node):
+    """Between low and high repetitions of child. high is None if there
+    is no upper bound."""
+    def __init__(self, child, low, high):
+        self.child = child
+        self.low = low
+        self.high = high
+
+    def symbol(self):
+        if (self.low, self.high) == (1, None):
+            return PLUS_SYM
+        if (self.low, self.high) == (0, 1):
+            return OPTIONAL_SYM
+        if self.low == self.high:
+            return f"{REPEAT_OPEN}{self.low}{REPEAT_CLOSE}"
+        high = "" if self.high is None else self.high
+        return f"{REPEAT_OPEN}{self.low},{high}{REPEAT_CLOSE}"
+
+    def __repr__(self):
+        return f"({self.symbol()} {repr(self.child)})"
+
+    def regex(self):
+        if isinstance(self.child, (Bin_Op_Node, Star_Node, Repeat_Node)):
+            return "({})".format(self.child.regex()) + self.symbol()
+        return self.child.regex() + self.symbol()
+
 class Bin_Op_Node(Regex_Node):
     def __init__(self, left, right):
         self.left = left
@@ -123,6 +179,7 @@ class Union_Node(Bin_Op_Node):
         return f"{self.left.regex()}{self.symbol}{self.right.regex()}"
 
 CHAR_NODES = {c: Character_Node(c) for c in string.printable}
+CLASS_NODES = {}
 LAMBDA_NODE = Lambda_Node()
 NULL_NODE = Null_Node()
 
@@ -134,7 +191,138 @@ def make_node(val):
         return LAMBDA_NODE
     if val == NULL_CHAR:
         return NULL_NODE
-    return CHAR_NODES.get(val)
+    if is_class_label(val):
+        if val not in CLASS_NODES:
+            CLASS_NODES[val] = Class_Node(val)
+        return CLASS_NODES[val]
+    if val not in CHAR_NODES:
+        CHAR_NODES[val] = Character_Node(val)
+    return CHAR_NODES[val]
+
+def is_class_label(label):
+    """Test if a transition label is a character class"""
+    return len(label) > 2 and label[0] == CLASS_OPEN and label[-1] == CLASS_CLOSE
+
+def parse_intervals(content):
+    """Get sorted tuple of disjoint (low, high) intervals from the text of
+    a character class without brackets, such as a-z0-9"""
+    intervals = []
+    i = 0
+    while i < len(content):
+        low = high = content[i]
+        if i + 2 < len(content) and content[i + 1] == RANGE_CHAR:
+            high = content[i + 2]
+            i += 3
+        else:
+            i += 1
+        if low > high:
+            raise SyntaxError(f"invalid range {low}{RANGE_CHAR}{high}")
+        intervals.append((low, high))
+
+    # merge overlapping and adjacent intervals
+    merged = []
+    for low, high in sorted(intervals):
+        if merged and ord(low) <= ord(merged[-1][1]) + 1:
+            if high > merged[-1][1]:
+                merged[-1] = (merged[-1][0], high)
+        else:
+            merged.append((low, high))
+    return tuple(merged)
+
+@lru_cache(maxsize=None)
+def class_intervals(label):
+    """Get the intervals of characters matched by a transition label"""
+    if is_class_label(label):
+        return parse_intervals(label[1:-1])
+    return ((label, label),)
+
+def class_label(intervals):
+    """Make the transition label matching a sorted tuple of disjoint
+    intervals. A single character that is not special is its own label."""
+    if len(intervals) == 1 and intervals[0][0] == intervals[0][1]:
+        if intervals[0][0] not in SPECIAL_CHARS:
+            return intervals[0][0]
+    # only the ends of intervals can be misread: ] ends the class unless
+    # it comes first, - makes a range unless it comes last, and ^ at the
+    # start negates the class. Those ends are split off as single
+    # characters; ] goes first, and ^ and - go last.
+    escaped = set()
+    parts = []
+    for low, high in intervals:
+        while low <= high and low in CLASS_ESCAPES:
+            escaped.add(low)
+            low = chr(ord(low) + 1)
+        while low <= high and high in CLASS_ESCAPES:
+            escaped.add(high)
+            high = chr(ord(high) - 1)
+        if low <= high:
+            parts.append(low if low == high else f"{low}{RANGE_CHAR}{high}")
+    if CLASS_CLOSE in escaped:
+        parts.insert(0, CLASS_CLOSE)
+    last = [c for c in (LAMBDA_CHAR, RANGE_CHAR) if c in escaped]
+    if not parts:
+        last.reverse()
+    return CLASS_OPEN + "".join(parts + last) + CLASS_CLOSE
+
+def label_chars(label):
+    """Generate the characters matched by a transition label"""
+    for low, high in class_intervals(label):
+        for code in range(ord(low), ord(high) + 1):
+            yield chr(code)
+
+def first_char(label):
+    return class_intervals(label)[0][0]
+
+class Interval_Table:
+    """Values attached to character intervals, which may overlap. get(char)
+    finds the values of all intervals containing char by binary search
+    over the sorted interval boundaries."""
+    def __init__(self, items):
+        items = list(items)
+        bounds = set()
+        for low, high, _ in items:
+            bounds.add(low)
+            if ord(high) < sys.maxunicode:
+                bounds.add(chr(ord(high) + 1))
+        self.starts = sorted(bounds)
+        # values[i] holds the values for chars in [starts[i], starts[i + 1])
+        self.values = [[] for _ in self.starts]
+        for low, high, value in items:
+            i = bisect_left(self.starts, low)
+            while i < len(self.starts) and self.starts[i] <= high:
+                self.values[i].append(value)
+                i += 1
+
+    def get(self, char):
+        i = bisect_right(self.starts, char) - 1
+        if i < 0:
+            return ()
+        return self.values[i]
+
+def atomize(labels):
+    """Split transition labels into atoms: disjoint intervals such that
+    each label is a union of atoms. Returns dict of label -> list of the
+    labels of its atoms."""
+    intervals = {label: class_intervals(label) for label in labels}
+    bounds = set()
+    for label_intervals in intervals.values():
+        for low, high in label_intervals:
+            bounds.add(ord(low))
+            bounds.add(ord(high) + 1)
+    bounds = sorted(bounds)
+    atoms = {}
+    for label, label_intervals in intervals.items():
+        if len(label_intervals) == 1 and label_intervals[0][0] == label_intervals[0][1]:
+            atoms[label] = [label]
+            continue
+        atoms[label] = []
+        for low, high in label_intervals:
+            i = bisect_left(bounds, ord(low))
+            while bounds[i] <= ord(high):
+                atom = ((chr(bounds[i]), chr(bounds[i + 1] - 1)),)
+                atoms[label].append(class_label(atom))
+                i += 1
+    return atoms
 
 def union_all(regex_nodes):
     """Create the regex union of a list of nodes"""
@@ -180,6 +368,19 @@ def simplify(node, desc_of_star=False):
         node.child = simplified_child
         return node
     
+    # simplify repeat node
+    if isinstance(node, Repeat_Node):
+        node.child = simplify(node.child)
+        if node.child == LAMBDA_NODE or node.high == 0:
+            return LAMBDA_NODE
+        if node.child == NULL_NODE:
+            return LAMBDA_NODE if node.low == 0 else NULL_NODE
+        if (node.low, node.high) == (1, 1):
+            return node.child
+        if (node.low, node.high) == (0, None):
+            return simplify(Star_Node(node.child), desc_of_star)
+        return node
+
     # binary op nodes
     if isinstance(node, Bin_Op_Node):
         desc_of_star = False if isinstance(node, Cat_Node) else desc_of_star
@@ -218,6 +419,58 @@ def simplify(node, desc_of_star=False):
                 return NULL_NODE
     return node
 
+def cat_operands(node):
+    """Get list of the operands of a chain of concatenations"""
+    if isinstance(node, Cat_Node):
+        return cat_operands(node.left) + cat_operands(node.right)
+    return [node]
+
+def condense(node):
+    """Rewrite parts of a regex parse tree with the + and ? operators:
+    r r* and r* r become r+, and r|^ becomes r?"""
+    if isinstance(node, (Star_Node, Repeat_Node)):
+        node.child = condense(node.child)
+    elif isinstance(node, Cat_Node):
+        operands = [condense(x) for x in cat_operands(node)]
+        i = 0
+        while i < len(operands):
+            star = operands[i]
+            if isinstance(star, Star_Node):
+                child = star.child.regex()
+                # look for a copy of the star's operand just before or after it
+                for m in range(1, max(i, len(operands) - i - 1) + 1):
+                    before = operands[max(i - m, 0):i]
+                    after = operands[i + 1:i + 1 + m]
+                    if before and reduce(Cat_Node, before).regex() == child:
+                        i -= m
+                        operands[i:i + m + 1] = [Repeat_Node(star.child, 1, None)]
+                        break
+                    if after and reduce(Cat_Node, after).regex() == child:
+                        operands[i:i + m + 1] = [Repeat_Node(star.child, 1, None)]
+                        break
+            i += 1
+        return reduce(Cat_Node, operands)
+    elif isinstance(node, Union_Node):
+        node.left = condense(node.left)
+        node.right = condense(node.right)
+        if LAMBDA_NODE in (node.left, node.right):
+            other = node.right if node.left == LAMBDA_NODE else node.left
+            if isinstance(other, Star_Node):
+                return other
+            return Repeat_Node(other, 0, 1)
+    return node
+
+def copy_tree(node):
+    """Copy the operator nodes of a regex parse tree, which simplify and
+    condense modify. Leaf nodes are shared, since they never change."""
+    if isinstance(node, Star_Node):
+        return Star_Node(copy_tree(node.child))
+    if isinstance(node, Repeat_Node):
+        return Repeat_Node(copy_tree(node.child), node.low, node.high)
+    if isinstance(node, Bin_Op_Node):
+        return type(node)(copy_tree(node.left), copy_tree(node.right))
+    return node
+
 class Regex_Parser:
     def __init__(self, regex=None, buf=None):
         self.stack = Stack()
@@ -236,9 +489,35 @@ class Regex_Parser:
             self.stack.push(UNION)
         elif c == CAT_SYM:
             self.stack.push(CAT)
-        else:
-            # star operator
+        elif c == STAR_SYM:
             self.push_node(Star_Node(self.stack.pop()))
+        elif c == PLUS_SYM:
+            self.push_node(Repeat_Node(self.stack.pop(), 1, None))
+        elif c == OPTIONAL_SYM:
+            self.push_node(Repeat_Node(self.stack.pop(), 0, 1))
+        else:
+            low, high = self.parse_counts()
+            self.push_node(Repeat_Node(self.stack.pop(), low, high))
+
+    def parse_counts(self):
+        """Read the counts of a {m}, {m,} or {m,n} operator after its
+        opening brace"""
+        chars = []
+        while (c := self.buf.get_next()) != REPEAT_CLOSE:
+            if c is None:
+                raise SyntaxError("missing closing brace")
+            chars.append(c)
+        low, comma, high = "".join(chars).partition(",")
+        if not low.isdigit() or not (high.isdigit() or high == ""):
+            raise SyntaxError("invalid repetition count")
+        low = int(low)
+        if not comma:
+            return low, low
+        if high == "":
+            return low, None
+        if int(high) < low:
+            raise SyntaxError("invalid repetition range")
+        return low, int(high)
 
     def push_node(self, node):
         """Push regex parse tree node"""
@@ -257,13 +536,29 @@ class Regex_Parser:
         else:
             self.stack.push(node)
 
+    def parse_class(self):
+        """Read a character class after its opening bracket"""
+        chars = []
+        # a closing bracket right after the opening one is a character
+        if self.buf.peek() == CLASS_CLOSE:
+            chars.append(self.buf.get_next())
+        while (c := self.buf.get_next()) != CLASS_CLOSE:
+            if c is None:
+                raise SyntaxError("missing closing bracket")
+            chars.append(c)
+        if not chars:
+            raise SyntaxError("empty character class")
+        if chars[0] == LAMBDA_CHAR:
+            raise SyntaxError("negated character classes are not supported")
+        return make_node(class_label(parse_intervals("".join(chars))))
+
     def get_next_op(self):
         next_char = self.buf.peek()
         if next_char == ")" or next_char == None:
             return None
         if next_char == UNION_SYM:
             return UNION
-        if next_char == STAR_SYM:
+        if next_char == STAR_SYM or next_char in REPEAT_SYM:
             return STAR
         return CAT
 
@@ -293,7 +588,13 @@ class Regex_Parser:
                     raise SyntaxError("unmatched parenthesis")
                 else:
                     return self.get_result()
-            elif c in OPERATOR_SYM:
+            elif c == CLASS_OPEN:
+                self.push_node(self.parse_class())
+            elif c == CLASS_CLOSE:
+                raise SyntaxError("unmatched bracket")
+            elif c == REPEAT_CLOSE:
+                raise SyntaxError("unmatched brace")
+            elif c in OPERATOR_SYM or c in REPEAT_SYM:
                 self.push_operator(c)
             else:
                 self.push_node(make_node(c))
@@ -303,6 +604,7 @@ class Regex_Parser:
             raise SyntaxError("missing closing parenthesis")
         return self.get_result()
 
+@timed("parse")
 def parse(regex, simple=True):
     tree = Regex_Parser(regex).parse()
     if simple:
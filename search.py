@@ -0,0 +1,85 @@
+#! /usr/bin/python3
+
+"""Substring search (grep) over strings and text files"""
+
+import mmap
+import os
+from fsa import NFA, NFA_State, DFA, LAMBDA_CHAR
+
+class Searcher:
+    """Find substrings in the language of an automaton.
+
+    The search runs an unanchored DFA for the language (alphabet)* L, so
+    every position of the input is scanned once. Characters are mapped to
+    their symbol class, and each state has one transition per class, so
+    the table size depends on the number of distinct behaviors rather
+    than the size of the alphabet. Characters outside the automaton's
+    alphabet form one more class, which leads back to the initial state."""
+    def __init__(self, fsa):
+        nfa = NFA(dfa=fsa) if isinstance(fsa, DFA) else fsa.copy()
+        start = NFA_State("Start")
+        for char in nfa.get_alphabet():
+            start.add_transition(char, start)
+        start.add_transition(LAMBDA_CHAR, nfa.init_state)
+        nfa.init_state = start
+        self.dfa = DFA(nfa=nfa)
+
+        # number the states and flatten the transitions into lists indexed
+        # by state and class number; characters outside the alphabet lead
+        # back to the initial state
+        states, self.char_classes, rows = self.dfa.transition_table()
+        ids = {state: i for i, state in enumerate(states)}
+        self.init = ids[self.dfa.init_state]
+        ids[None] = self.init
+        self.transitions = [[ids[dest] for dest in row] for row in rows]
+        self.final = [state in self.dfa.final_states for state in states]
+
+    def find_ends(self, text):
+        """Generate each offset in text where a matching substring ends"""
+        transitions, final, init = self.transitions, self.final, self.init
+        char_classes = self.char_classes
+        state = init
+        if final[state]:
+            yield 0
+        for i, char in enumerate(text, 1):
+            state = transitions[state][char_classes[char]]
+            if final[state]:
+                yield i
+
+    def matches(self, text):
+        """Test if any substring of text is accepted"""
+        transitions, final, init = self.transitions, self.final, self.init
+        char_classes = self.char_classes
+        state = init
+        if final[state]:
+            return True
+        for char in text:
+            state = transitions[state][char_classes[char]]
+            if final[state]:
+                return True
+        return False
+
+    def _read_lines(self, filename, encoding):
+        """Generate (line number, line) pairs of a file read through mmap"""
+        with open(filename, "rb") as file:
+            # mmap cannot map an empty file
+            if os.fstat(file.fileno()).st_size == 0:
+                return
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                for number, raw in enumerate(iter(buf.readline, b""), 1):
+                    line = raw.decode(encoding, errors="replace")
+                    yield number, line.rstrip("\r\n")
+
+    def grep(self, filename, encoding="utf-8"):
+        """Generate (line number, line) for each line of a file containing
+        a matching substring. Matches do not span lines."""
+        for number, line in self._read_lines(filename, encoding):
+            if self.matches(line):
+                yield number, line
+
+    def grep_offsets(self, filename, encoding="utf-8"):
+        """Generate (line number, offset) for each position in a file
+        where a matching substring ends"""
+        for number, line in self._read_lines(filename, encoding):
+            for offset in self.find_ends(line):
+                yield number, offset
@@ -0,0 +1,186 @@
+#! /usr/bin/python3
+
+"""Local socket server answering membership queries for one automaton.
+
+The automaton is loaded and constructed once at startup. Clients send
+line-delimited requests and get one response line per request:
+    test <STRING>   ->  accept | reject
+    stats           ->  JSON object with throughput and latency figures
+Requests that arrive while a batch is being answered are coalesced into
+the next batch, which runs through a single matcher.
+
+Usage:
+    python3 server.py (--regex REGEX | --file FILE | --jflap FILE)
+                      [--dfa] [--port PORT | --unix PATH]
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+from time import perf_counter
+from fsa import NFA, DFA, Transition_Graph, FSA_Error, LAMBDA_CHAR
+from matcher import make_matcher
+
+DEFAULT_PORT = 7406
+MAX_BATCH = 1024
+ACCEPT_REJECT = {True: "accept", False: "reject"}
+
+def load_fsa(regex=None, filename=None, jflap=None, to_dfa=False):
+    """Load an automaton the same way the REPL does"""
+    if regex is not None:
+        fsa = NFA(regex=regex)
+    else:
+        tg = Transition_Graph(filename=filename, jflap=jflap)
+        fsa = DFA(tg=tg) if tg.is_dfa() else NFA(tg=tg)
+    if to_dfa:
+        if isinstance(fsa, NFA):
+            fsa = DFA(nfa=fsa)
+        fsa = fsa.reduce()
+    return fsa
+
+class Membership_Server:
+    """Answer test requests in batches"""
+    def __init__(self, fsa, max_batch=MAX_BATCH):
+        self.matcher = make_matcher(fsa)
+        self.max_batch = max_batch
+        self.queue = None
+        self.num_requests = 0
+        self.num_batches = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self.start_time = perf_counter()
+
+    def test_batch(self, strings):
+        """Test a list of strings with the shared matcher"""
+        results = []
+        matcher = self.matcher
+        for s in strings:
+            matcher.reset()
+            matcher.feed("" if s == LAMBDA_CHAR else s)
+            results.append(matcher.accepting())
+        return results
+
+    async def batch_worker(self):
+        """Answer all queued requests as one batch, then repeat"""
+        while True:
+            batch = [await self.queue.get()]
+            while not self.queue.empty() and len(batch) < self.max_batch:
+                batch.append(self.queue.get_nowait())
+            try:
+                results = self.test_batch([s for s, _, _ in batch])
+            except Exception as e:
+                # fail this batch's requests, but keep serving
+                results = [e] * len(batch)
+            now = perf_counter()
+            for (_, future, received), result in zip(batch, results):
+                if not future.cancelled():
+                    if isinstance(result, Exception):
+                        future.set_exception(result)
+                    else:
+                        future.set_result(result)
+                latency = now - received
+                self.total_latency += latency
+                self.max_latency = max(self.max_latency, latency)
+            self.num_requests += len(batch)
+            self.num_batches += 1
+
+    def get_stats(self):
+        elapsed = perf_counter() - self.start_time
+        return {
+            "requests": self.num_requests,
+            "batches": self.num_batches,
+            "mean_batch_size": self.num_requests / max(self.num_batches, 1),
+            "requests_per_second": self.num_requests / elapsed,
+            "mean_latency_ms": 1000 * self.total_latency / max(self.num_requests, 1),
+            "max_latency_ms": 1000 * self.max_latency,
+            "uptime_seconds": elapsed,
+        }
+
+    async def handle_client(self, reader, writer):
+        """Read requests from one client; replies are written in order"""
+        loop = asyncio.get_running_loop()
+        replies = asyncio.Queue()
+
+        async def write_replies():
+            while True:
+                reply = await replies.get()
+                if reply is None:
+                    break
+                if isinstance(reply, asyncio.Future):
+                    try:
+                        reply = ACCEPT_REJECT[await reply]
+                    except Exception as e:
+                        reply = f"error: {e}"
+                writer.write((reply + "\n").encode())
+                if replies.empty():
+                    await writer.drain()
+
+        writer_task = asyncio.create_task(write_replies())
+        try:
+            while line := await reader.readline():
+                try:
+                    line = line.decode()
+                except UnicodeDecodeError:
+                    await replies.put("error: request is not valid UTF-8")
+                    continue
+                command, _, arg = line.rstrip("\r\n").partition(" ")
+                if command == "test":
+                    future = loop.create_future()
+                    await self.queue.put((arg, future, perf_counter()))
+                    await replies.put(future)
+                elif command == "stats":
+                    await replies.put(json.dumps(self.get_stats()))
+                else:
+                    await replies.put(f"error: unrecognized request {command!r}")
+        finally:
+            await replies.put(None)
+            await writer_task
+            writer.close()
+
+    async def start(self, port=DEFAULT_PORT, path=None):
+        """Start serving on localhost TCP port, or on a Unix socket if path
+        is given. Returns the asyncio server."""
+        self.queue = asyncio.Queue()
+        self.worker = asyncio.create_task(self.batch_worker())
+        if path is not None:
+            return await asyncio.start_unix_server(self.handle_client, path=path)
+        return await asyncio.start_server(self.handle_client, "127.0.0.1", port)
+
+async def serve(fsa, port=DEFAULT_PORT, path=None):
+    server = Membership_Server(fsa)
+    async with await server.start(port, path) as socket_server:
+        address = path or f"127.0.0.1:{socket_server.sockets[0].getsockname()[1]}"
+        print("Serving membership queries on", address, file=sys.stderr)
+        try:
+            await socket_server.serve_forever()
+        finally:
+            print(json.dumps(server.get_stats()), file=sys.stderr)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve FSA membership queries")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--regex", help="load automaton from a regex")
+    source.add_argument("--file", help="load transition graph file")
+    source.add_argument("--jflap", help="load jflap xml file")
+    parser.add_argument("--dfa", action="store_true",
+                        help="convert to a minimal DFA before serving")
+    address = parser.add_mutually_exclusive_group()
+    address.add_argument("--port", type=int, default=DEFAULT_PORT,
+                         help="TCP port on 127.0.0.1")
+    address.add_argument("--unix", help="path of a Unix socket")
+    args = parser.parse_args(argv)
+
+    try:
+        fsa = load_fsa(args.regex, args.file, args.jflap, args.dfa)
+    except (FSA_Error, SyntaxError, OSError) as e:
+        print("Error: cannot load automaton:", e, file=sys.stderr)
+        return 1
+    try:
+        asyncio.run(serve(fsa, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,10 +1,31 @@
 #! /usr/bin/python3
 
 import unittest
+import unittest.mock
+import asyncio
+import tempfile
+import os
+import json
 from regex import parse
 from load_regex_cases import load_regex_cases
 from load_fsa_cases import make_FSA_case
 from fsa import *
+from metrics import METRICS
+from compact_nfa import Compact_NFA
+from search import Searcher
+from matcher import make_matcher
+from server import Membership_Server
+from multi_dfa import Multi_DFA
+from lexer import Lexer, Lex_Error, Token
+from cache import Compile_Cache, regex_key, file_key
+from disk_dfa import Disk_DFA
+from parallel_dfa import parallel_determinize, Bitset_NFA
+from planner import Planner, Lazy_DFA, ENGINES
+import memo
+import cli
+import contextlib
+import io
+from time import perf_counter
 
 class Test_Regex(unittest.TestCase):
     def test_regex_parser(self):
@@ -95,6 +116,657 @@ class Test_Regex(unittest.TestCase):
             msg = f"{case.path} accepted {test_string}"
             self.assertFalse(test_dfa.test(test_string), msg)
 
+    def test_enumerate(self):
+        print("Testing enumeration of accepted strings")
+        test_nfa = NFA(regex="(a|b)*c")
+        self.assertEqual(list(test_nfa.enumerate(2)), ["c", "ac", "bc"])
+        self.assertEqual(list(test_nfa.enumerate(3, limit=4)),
+                         ["c", "ac", "bc", "aac"])
+        self.assertEqual(list(test_nfa.enumerate(3, limit=0)), [])
+        test_dfa = DFA(nfa=test_nfa)
+        self.assertEqual(list(test_dfa.enumerate(2)), ["c", "ac", "bc"])
+        self.assertEqual(list(NFA(regex="a*").enumerate(2)), ["", "a", "aa"])
+        self.assertEqual(list(NFA(regex="~").enumerate(5)), [])
+
+    def test_sample(self):
+        print("Testing random sampling of accepted and rejected strings")
+        test_dfa = DFA(nfa=NFA(regex="(a|b)*c"))
+        samples = test_dfa.sample(4, 200, seed=1)
+        self.assertEqual(len(samples), 200)
+        for s in samples:
+            self.assertEqual(len(s), 4)
+            self.assertTrue(test_dfa.test(s), s)
+        for s in test_dfa.sample_rejected(4, 200, seed=1):
+            self.assertEqual(len(s), 4)
+            self.assertFalse(test_dfa.test(s), s)
+        self.assertEqual(test_dfa.sample(4, 10, seed=3),
+                         test_dfa.sample(4, 10, seed=3))
+        self.assertEqual(test_dfa.sample(0, 5), [])
+        self.assertEqual(test_dfa.sample_rejected(0, 2), ["", ""])
+
+        # each of the 4 accepted strings should be drawn about equally often
+        counts = defaultdict(int)
+        for s in DFA(nfa=NFA(regex="(a|b)(a|b)")).sample(2, 4000, seed=2):
+            counts[s] += 1
+        self.assertEqual(set(counts), {"aa", "ab", "ba", "bb"})
+        for count in counts.values():
+            self.assertTrue(800 < count < 1200, counts)
+
+    def test_metrics(self):
+        print("Testing engine counters and timers")
+        METRICS.reset()
+        NFA(regex="ab").test("ab")
+        self.assertEqual(METRICS.snapshot(), {"counters": {}, "timers": {}})
+
+        METRICS.enabled = True
+        try:
+            test_nfa = NFA(regex="(a|b)*ab")
+            test_nfa.test("abab")
+            test_dfa = DFA(nfa=test_nfa).reduce()
+            test_dfa.test("abab")
+            test_nfa.to_regex()
+        finally:
+            METRICS.enabled = False
+        snapshot = METRICS.snapshot()
+        METRICS.reset()
+        counters = snapshot["counters"]
+        self.assertEqual(counters["nfa_tests"], 1)
+        self.assertEqual(counters["dfa_tests"], 1)
+        self.assertEqual(counters["dfa_states_visited"], 5)
+        for name in ("closure_computations", "nfa_states_visited",
+                     "subset_states_created", "subset_cache_hits",
+                     "reduce_refinement_rounds", "suppress_nodes_created"):
+            self.assertGreater(counters[name], 0, name)
+        for phase in ("parse", "nfa_construction", "convert_from_NFA",
+                      "reduce", "to_regex"):
+            self.assertGreaterEqual(snapshot["timers"][phase]["calls"], 1)
+
+    def test_compact_nfa(self):
+        print("Testing compact array-backed nfa")
+        cases = load_regex_cases("testing/regex_test_cases")
+        for case in cases:
+            test_nfa = NFA(regex=case.regex)
+            compact = Compact_NFA(test_nfa)
+            self.assertEqual(len(compact), len(test_nfa.get_state_list()))
+            converted = [compact, compact.to_dfa(), compact.to_nfa()]
+            for s in case.accepted:
+                for fsa in converted:
+                    self.assertTrue(fsa.test(s), f"{case.regex} rejected {s}")
+            for s in case.rejected:
+                for fsa in converted:
+                    self.assertFalse(fsa.test(s), f"{case.regex} accepted {s}")
+
+        # lambda cycles and multiple transitions on one character
+        case = make_FSA_case("testing/wb_cases/nfa_test")
+        compact = Compact_NFA(NFA(jflap=f"{case.path}.jff"))
+        for s in case.accept:
+            self.assertTrue(compact.test(s))
+            self.assertTrue(compact.to_dfa().test(s))
+        for s in case.reject:
+            self.assertFalse(compact.test(s))
+            self.assertFalse(compact.to_dfa().test(s))
+
+    def test_search(self):
+        print("Testing substring search")
+        searcher = Searcher(NFA(regex="ab*c"))
+        self.assertEqual(list(searcher.find_ends("xacyabbc_ac")), [3, 8, 11])
+        self.assertTrue(searcher.matches("zzabbbcz"))
+        self.assertFalse(searcher.matches("abbb ab"))
+        self.assertTrue(Searcher(NFA(regex="b*")).matches(""))
+
+        searcher = Searcher(DFA(nfa=NFA(regex="(a|b)*bb")))
+        lines = ["no match here", "abba", "", "b b", "xxbbbx"]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "text")
+            with open(path, "w") as file:
+                file.write("\n".join(lines) + "\n")
+            self.assertEqual(list(searcher.grep(path)),
+                             [(2, "abba"), (5, "xxbbbx")])
+            self.assertEqual(list(searcher.grep_offsets(path)),
+                             [(2, 3), (5, 4), (5, 5)])
+            empty_path = os.path.join(tmp_dir, "empty")
+            open(empty_path, "w").close()
+            self.assertEqual(list(searcher.grep(empty_path)), [])
+
+    def test_symbol_classes(self):
+        print("Testing symbol equivalence classes")
+        test_nfa = NFA(regex="(a|b|c|d)*(a|b)e")
+        self.assertEqual(test_nfa.get_symbol_classes(), [["a", "b"], ["c", "d"], ["e"]])
+        test_dfa = DFA(nfa=test_nfa)
+        self.assertEqual(test_dfa.get_symbol_classes(), [["a", "b"], ["c", "d"], ["e"]])
+        self.assertEqual(test_dfa.get_alphabet(), set("abcde"))
+        states, char_classes, rows = test_dfa.transition_table()
+        self.assertEqual([char_classes[c] for c in "adez"], [0, 1, 2, 3])
+        for state, row in zip(states, rows):
+            self.assertEqual(row, [state.next(c) for c in "ace"] + [None])
+        reduced = test_dfa.reduce()
+        for s in ("ae", "cbe", "dde", "abce", "e"):
+            self.assertEqual(reduced.test(s), test_nfa.test(s), s)
+        self.assertEqual(len(Searcher(test_nfa).transitions[0]), 4)
+
+    def test_char_classes(self):
+        print("Testing character classes")
+        test_nfa = NFA(regex="[a-z]*[0-9]|x[a-c]")
+        self.assertEqual(test_nfa.get_alphabet(), {"[a-z]", "[0-9]", "x", "[a-c]"})
+        test_dfa = DFA(nfa=test_nfa)
+        # overlapping classes are split into disjoint atoms
+        self.assertEqual(test_dfa.get_alphabet(), {"[0-9]", "[a-c]", "[d-w]", "x", "[y-z]"})
+        reduced = test_dfa.reduce()
+        for s in ("5", "abc7", "xb", "xd9", "q"):
+            self.assertEqual(reduced.test(s), test_nfa.test(s), s)
+            self.assertEqual(Compact_NFA(test_nfa).test(s), test_nfa.test(s), s)
+        self.assertTrue(test_nfa.test("xb"))
+        self.assertFalse(test_nfa.test("xd"))
+        self.assertEqual(list(NFA(regex="[a-c]").enumerate(1)), ["a", "b", "c"])
+        # ^ is never written first, where it would mean a negated class
+        self.assertEqual(str(NFA(regex="[a^]").to_regex()), "[a^]")
+        for regex in ("[a^]", "x[b^-a]", "[-^]", "[Z-^]"):
+            test_nfa = NFA(regex=regex)
+            round_trip = NFA(regex=str(test_nfa.to_regex()))
+            for s in ("a", "xb", "x_", "-", "Z", "]", "xa^"):
+                self.assertEqual(round_trip.test(s), test_nfa.test(s), (regex, s))
+        # ] first in a class is a character
+        self.assertEqual(list(NFA(regex="[]a]").enumerate(1)), ["]", "a"])
+
+        # special characters in transition labels are written as classes
+        labels = "+?{}[]()|.-"
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "graph")
+            with open(path, "w") as file:
+                file.write("@0\n!\n" + "".join(f"{c}: 1\n" for c in labels)
+                           + "x: 2\n@1\n*\n@2\n]: 1\n[Z-a]: 1\n")
+            loaded = NFA(filename=path)
+        for fsa in (loaded, DFA(nfa=loaded)):
+            regex = str(fsa.to_regex())
+            self.assertIn("[+]", regex)
+            round_trip = NFA(regex=regex)
+            for s in list(labels) + ["x]", "x^", "x_", "x[", "xx", "+?", "a"]:
+                self.assertEqual(round_trip.test(s), loaded.test(s), (regex, s))
+
+        # interval lookup by binary search
+        table = Interval_Table([("a", "m", 1), ("f", "z", 2)])
+        self.assertEqual(table.get("b"), [1])
+        self.assertEqual(table.get("g"), [1, 2])
+        self.assertEqual(table.get("0"), ())
+        symbol_map = Symbol_Map([["[a-c]", "x"], ["[0-9]"]], default=2)
+        self.assertEqual([symbol_map[c] for c in "bx5%"], [0, 0, 1, 2])
+
+        # class labels in transition graph files
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "graph")
+            with open(path, "w") as file:
+                file.write("@0\n!\n[a-z]: 0\n[0-9]: 1\n@1\n*\n")
+            loaded = NFA(filename=path)
+            self.assertTrue(loaded.test("abc1"))
+            self.assertFalse(loaded.test("1a"))
+
+    def test_repeat(self):
+        print("Testing bounded repetition")
+        # the repeated NFA is copied, so size grows linearly with the count
+        test_nfa = NFA(regex="(ab|c){500}")
+        self.assertLess(len(test_nfa.get_state_list()), 5 * 500)
+        self.assertTrue(test_nfa.test("ab" * 250 + "c" * 250))
+        self.assertFalse(test_nfa.test("ab" * 499))
+        # copies are joined without lambda chains between them, so
+        # nullable bodies with large counts stay fast
+        start = perf_counter()
+        test_nfa = NFA(regex="(a?){500}")
+        self.assertTrue(test_nfa.test("aaa"))
+        self.assertFalse(test_nfa.test("a" * 501))
+        test_dfa = DFA(nfa=test_nfa)
+        self.assertEqual(len(test_dfa.get_state_list()), 502)
+        test_nfa = NFA(regex="(ab?){3,300}")
+        self.assertFalse(test_nfa.test("abab"))
+        self.assertTrue(DFA(nfa=test_nfa).test("ab" * 100 + "a" * 200))
+        self.assertFalse(DFA(nfa=test_nfa).test("a" * 301))
+        self.assertLess(perf_counter() - start, 5)
+        test_dfa = DFA(nfa=NFA(regex="a{2,4}b?")).reduce()
+        self.assertEqual([s for s in ("a", "aa", "aaaab", "aaaaa") if test_dfa.test(s)],
+                         ["aa", "aaaab"])
+        # + and ? are recognized when converting back to a regex
+        self.assertEqual(str(NFA(regex="(ab)(ab)*c").to_regex()), "(ab)+c")
+        self.assertEqual(str(NFA(regex="a|^").to_regex()), "a?")
+        self.assertEqual(repr(simplify(parse("(a*){1}"))), "(* a)")
+
+    def test_words(self):
+        print("Testing minimal dfa construction from word lists")
+        words = ["tap", "taps", "top", "tops", "stop", "stops", "^", "s"]
+        # the result is minimal and independent of the word order
+        for order in (words, sorted(words), words[::-1]):
+            test_dfa = DFA(words=order)
+            self.assertEqual(len(test_dfa.get_state_list()), 7)
+            for s in words:
+                self.assertTrue(test_dfa.test(s), s)
+            for s in ("t", "ta", "tapss", "sto", "x", "ss"):
+                self.assertFalse(test_dfa.test(s), s)
+        # reduce works on the partial DFA
+        self.assertEqual(len(test_dfa.reduce().get_state_list()), 7)
+        self.assertEqual(len(DFA(words=[]).get_state_list()), 1)
+        self.assertRaises(FSA_Error, lambda: DFA(words=["a^b"]))
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "words")
+            with open(path, "w") as file:
+                file.write("cat\n\ncats\ndog\n")
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output):
+                status = cli.main(["load", "words", path, "test", "cats", "test", "ca"])
+            self.assertEqual(status, cli.EXIT_REJECTED)
+            results = [json.loads(line) for line in output.getvalue().splitlines()]
+            self.assertEqual(results[0]["type"], "DFA")
+            self.assertEqual([(r["string"], r["accepted"]) for r in results[1:]],
+                             [("cats", True), ("ca", False)])
+            loaded = DFA(words=read_words(path))
+            self.assertFalse(loaded.test(LAMBDA_CHAR))
+            self.assertTrue(loaded.test("dog"))
+
+    def test_disk_dfa(self):
+        print("Testing disk-backed subset construction")
+        test_nfa = NFA(regex="(a|b)*a(a|b){3}c?")
+        num_states = len(Compact_NFA(test_nfa).to_dfa().get_state_list())
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "dfa.db")
+            # stop part way, then resume from the checkpoint in a new object
+            with Disk_DFA(path, test_nfa) as disk_dfa:
+                self.assertFalse(disk_dfa.build(checkpoint_interval=2, max_states=5))
+                self.assertEqual(disk_dfa.expanded, 5)
+            progress = []
+            with Disk_DFA(path, test_nfa) as disk_dfa:
+                self.assertTrue(disk_dfa.build(progress=lambda *p: progress.append(p)))
+                self.assertEqual(progress[-1], (num_states, num_states))
+                for s in ("abbb", "aaaac", "babab", "bbbb", "^", "ab"):
+                    self.assertEqual(disk_dfa.test(s), test_nfa.test(s), s)
+                reduced = disk_dfa.to_dfa().reduce()
+                self.assertTrue(reduced.test("baabac"))
+            # a finished file can be opened without the NFA
+            with Disk_DFA(path) as disk_dfa:
+                self.assertTrue(disk_dfa.test("abbb"))
+                self.assertFalse(disk_dfa.test("xabbb"))
+            self.assertRaises(FSA_Error, lambda: Disk_DFA(path, NFA(regex="ab")))
+            self.assertRaises(FSA_Error, lambda: Disk_DFA(os.path.join(tmp_dir, "new.db")))
+
+    def test_parallel_dfa(self):
+        print("Testing parallel subset construction")
+        test_nfa = NFA(regex="(a|b)*a(a|b){8}|c[a-c]*")
+        expected = Compact_NFA(test_nfa).to_dfa()
+        for workers in (1, 2):
+            test_dfa = parallel_determinize(test_nfa, workers)
+            self.assertEqual(len(test_dfa.get_state_list()),
+                             len(expected.get_state_list()))
+            self.assertEqual(len(test_dfa.reduce().get_state_list()),
+                             len(expected.reduce().get_state_list()))
+            for s in ("abbbbbbbb", "bbbbbbbbb", "cab", "ca", "^", "x"):
+                self.assertEqual(test_dfa.test(s), test_nfa.test(s), s)
+        bits = Bitset_NFA.to_bits([0, 3, 64])
+        self.assertEqual(Bitset_NFA.from_bits(bits), [0, 3, 64])
+
+    def test_reverse(self):
+        print("Testing automaton reversal")
+        test_nfa = NFA(regex="(a|b)*a(a|b){2}|c[a-c]")
+        test_dfa = DFA(nfa=test_nfa)
+        for fsa in (test_nfa, test_dfa):
+            reversed_nfa = fsa.reverse()
+            for s in ("abb", "baab", "bba", "ca", "ac", "c"):
+                self.assertEqual(reversed_nfa.test(s[::-1]), fsa.test(s), s)
+        self.assertTrue(NFA(regex="a*").reverse().test(LAMBDA_CHAR))
+        self.assertFalse(NFA(regex="~").reverse().test(LAMBDA_CHAR))
+
+        # Brzozowski's method gives the minimal DFA
+        minimal = test_dfa.reduce()
+        for fsa in (test_nfa, test_dfa):
+            self.assertEqual(len(fsa.brzozowski().get_state_list()),
+                             len(minimal.get_state_list()))
+
+        # the DFA of (a|b)*a(a|b){n} has 2^(n+1) states, its reverse n+3
+        matcher = make_matcher(NFA(regex="(a|b)*a(a|b){16}"), reverse=True)
+        self.assertEqual(len(matcher.transitions), 19)
+        for s, accepted in (("b" + "a" * 17, True), ("a" + "b" * 16, True),
+                            ("ab" + "b" * 16, False), ("a", False)):
+            matcher.reset()
+            # chunks are fed last first
+            matcher.feed(s[-5:])
+            matcher.feed(s[:-5])
+            self.assertEqual(matcher.accepting(), accepted, s)
+
+    def test_planner(self):
+        print("Testing test engine selection")
+        small = NFA(regex="(a|b)*abb")
+        self.assertEqual(Planner(small).engine, "dfa")
+        self.assertEqual(Planner(DFA(nfa=small)).engine, "dfa")
+        self.assertEqual(Planner(NFA(dfa=DFA(words=["ab", "b"] * 300))).engine, "dfa")
+        wide = NFA(regex="(a|b)*a(a|b){12}")
+        planner = Planner(wide)
+        self.assertEqual(planner.engine, "lazy_dfa")
+        self.assertIsNone(planner.estimate["dfa_states"])
+        strings = ("b" + "a" * 13, "a" + "b" * 12, "ab" + "b" * 12, "a", LAMBDA_CHAR)
+        for fsa in (small, wide):
+            planners = [Planner(fsa, engine) for engine in ENGINES]
+            for s in strings:
+                for planner in planners:
+                    self.assertEqual(planner.test(s), fsa.test(s), (s, planner.describe()))
+
+        # a lazy DFA that keeps overflowing its cache falls back to set simulation
+        planner = Planner(wide, "lazy_dfa")
+        planner.matcher = Lazy_DFA(planner.get_compact(), max_states=8, max_flushes=2)
+        self.assertTrue(planner.test("ab" * 20 + "a" * 13))
+        self.assertEqual(planner.engine, "nfa")
+        # so does backtracking that explores too many paths
+        planner = Planner(NFA(regex="(a|aa)*b"), "backtrack")
+        self.assertFalse(planner.test("a" * 30))
+        self.assertEqual(planner.engine, "nfa")
+
+    def test_reject_position(self):
+        print("Testing early rejection")
+        test_nfa = NFA(regex="(a|b)*c|ab")
+        test_dfa = DFA(nfa=test_nfa)
+        for fsa in (test_nfa, test_dfa, test_nfa.remove_lambdas()):
+            self.assertIsNone(fsa.reject_position("abbc"))
+            self.assertIsNone(fsa.reject_position("ab"))
+            self.assertEqual(fsa.reject_position("abcab"), 4)
+            self.assertEqual(fsa.reject_position("ba"), 2)
+            self.assertEqual(fsa.reject_position("d" * 1000), 1)
+            self.assertFalse(fsa.test("abc" + "a" * 5000))
+        self.assertEqual(NFA(regex="~").reject_position("abc"), 0)
+
+        # useless states are removed by trim
+        trimmed = test_nfa.trim()
+        states = trimmed.get_state_list()
+        self.assertEqual(trimmed.cached_live_states(), set(states))
+
+    def test_matcher(self):
+        print("Testing chunked matchers")
+        test_nfa = NFA(regex="(ab|b)*a")
+        for fsa in (test_nfa, DFA(nfa=test_nfa), DFA(nfa=test_nfa).reduce()):
+            matcher = make_matcher(fsa)
+            for s in ("a", "aba", "bbbaba", "", "ab", "aa", "bab"):
+                matcher.reset()
+                for i in range(0, len(s), 2):
+                    matcher.feed(s[i:i + 2])
+                self.assertEqual(matcher.accepting(), fsa.test(s), s)
+                self.assertEqual(matcher.position, len(s))
+
+            matcher.reset()
+            matcher.feed("ba")
+            self.assertTrue(matcher.accepting())
+            self.assertFalse(matcher.dead())
+            self.assertIsNone(matcher.reject_position)
+            matcher.feed("a")
+            self.assertFalse(matcher.accepting())
+            self.assertTrue(matcher.dead())
+            matcher.feed("ab" * 100)
+            self.assertTrue(matcher.dead())
+            self.assertEqual(matcher.position, 203)
+            self.assertEqual(matcher.reject_position, 3)
+            self.assertTrue(make_matcher(NFA(regex="~")).dead())
+
+        async def match(data):
+            reader = asyncio.StreamReader()
+            reader.feed_data(data)
+            reader.feed_eof()
+            return await make_matcher(test_nfa).feed_stream(reader, chunk_size=3)
+        self.assertTrue(asyncio.run(match(b"abbbaba")))
+        self.assertFalse(asyncio.run(match(b"abbbab")))
+
+    def test_server(self):
+        print("Testing membership query server")
+        async def run():
+            server = Membership_Server(NFA(regex="(ab)*"))
+            socket_server = await server.start(port=0)
+            port = socket_server.sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(b"test ab\ntest aba\ntest ^\nbogus\ntest abab\n")
+            await writer.drain()
+            replies = [(await reader.readline()).decode().strip()
+                       for _ in range(5)]
+            writer.write(b"stats\n")
+            replies.append(json.loads(await reader.readline()))
+
+            # bad requests and failed batches get error replies, and the
+            # connection and the batch worker keep going
+            writer.write(b"test \xffab\ntest ab\n")
+            await writer.drain()
+            replies += [(await reader.readline()).decode().strip() for _ in range(2)]
+            test_batch = server.test_batch
+            def fail(strings):
+                server.test_batch = test_batch
+                raise ValueError("matcher failed")
+            server.test_batch = fail
+            writer.write(b"test ab\n")
+            await writer.drain()
+            replies.append((await reader.readline()).decode().strip())
+            writer.write(b"test abab\n")
+            await writer.drain()
+            replies.append((await reader.readline()).decode().strip())
+            writer.close()
+            await writer.wait_closed()
+            socket_server.close()
+            await socket_server.wait_closed()
+            server.worker.cancel()
+            return replies
+
+        replies = asyncio.run(run())
+        self.assertEqual(replies[:3], ["accept", "reject", "accept"])
+        self.assertTrue(replies[3].startswith("error"))
+        self.assertEqual(replies[4], "accept")
+        self.assertEqual(replies[5]["requests"], 4)
+        self.assertEqual(replies[6:], ["error: request is not valid UTF-8", "accept",
+                                       "error: matcher failed", "accept"])
+        self.assertLessEqual(replies[5]["batches"], 4)
+
+    def test_multi_dfa(self):
+        print("Testing multi-pattern dfa")
+        patterns = ["ab*", "a(b|c)", "c*", "abb", "(a|b)*c", "~"]
+        multi = Multi_DFA(patterns)
+        reduced = multi.reduce()
+        self.assertLessEqual(len(reduced.get_state_list()),
+                             len(multi.get_state_list()))
+        self.assertEqual(multi.match("ab"), {0, 1})
+        self.assertEqual(multi.match("^"), {2})
+        self.assertEqual(reduced.match_patterns("abb"), ["ab*", "abb"])
+        self.assertEqual(multi.match("xyz"), set())
+
+        nfas = [NFA(regex=p) for p in patterns]
+        strings = [""] + list(NFA(regex="(a|b|c)*").enumerate(4))
+        for s in strings:
+            expected = {i for i, nfa in enumerate(nfas) if nfa.test(s)}
+            self.assertEqual(multi.match(s), expected, s)
+            self.assertEqual(reduced.match(s), expected, s)
+            self.assertEqual(reduced.test(s), bool(expected), s)
+
+    def test_lexer(self):
+        print("Testing maximal munch lexer")
+        letter = "(" + "|".join("abcdefghijklmnopqrstuvwxyz") + ")"
+        digit = "(" + "|".join("0123456789") + ")"
+        lexer = Lexer([("IF", "if"), ("ID", f"{letter}({letter}|{digit})*"),
+                       ("NUM", f"{digit}{digit}*"), ("OP", "=|==|<|<="),
+                       ("WS", "  *")])
+        text = "if ifx==12 x1<=if"
+        tokens = list(lexer.tokenize(text, skip=("WS",)))
+        self.assertEqual(tokens, [
+            Token("IF", "if", 0), Token("ID", "ifx", 3), Token("OP", "==", 6),
+            Token("NUM", "12", 8), Token("ID", "x1", 11), Token("OP", "<=", 13),
+            Token("IF", "if", 15)])
+        self.assertEqual(len(list(lexer.tokenize(text))), 9)
+
+        # tokens spanning chunk boundaries
+        for size in (1, 2, 3, 5):
+            chunks = [text[i:i + size] for i in range(0, len(text), size)]
+            self.assertEqual(list(lexer.tokenize_chunks(chunks, ("WS",))), tokens)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "source")
+            with open(path, "w") as file:
+                file.write(text)
+            self.assertEqual(list(lexer.tokenize_file(path, ("WS",), chunk_size=4)),
+                             tokens)
+
+        with self.assertRaises(Lex_Error):
+            list(lexer.tokenize("x = y;"))
+
+        # failed lookahead is not rescanned, so tokenizing stays linear
+        lexer = Lexer([("A", "a"), ("B", "a*b")])
+        start = perf_counter()
+        self.assertEqual(len(list(lexer.tokenize("a" * 100000))), 100000)
+        chunks = ["a" * 1000] * 100 + ["b"]
+        self.assertEqual(list(lexer.tokenize_chunks(chunks)),
+                         [Token("B", "a" * 100000 + "b", 0)])
+        self.assertEqual(list(lexer.tokenize_chunks(["a" * 1000] * 3))[-1],
+                         Token("A", "a", 2999))
+        # pruning failed pairs before the current token keeps the results
+        with unittest.mock.patch("lexer.MIN_FAILED_PRUNE", 1):
+            self.assertEqual(len(list(lexer.tokenize("a" * 100000 + "b" + "a" * 10))),
+                             11)
+            self.assertEqual(list(lexer.tokenize_chunks(["a" * 1000] * 3))[-1],
+                             Token("A", "a", 2999))
+        self.assertLess(perf_counter() - start, 5)
+        with self.assertRaises(Lex_Error):
+            Lexer([("A", "a"), ("EMPTY", "b*")])
+
+    def test_compile_cache(self):
+        print("Testing on-disk compilation cache")
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache = Compile_Cache(tmp_dir)
+            key = regex_key("(a|b)*abb")
+            self.assertIsNone(cache.get(key, "nfa"))
+            test_nfa = cache.get_or_build(key, "nfa", lambda: NFA(regex="(a|b)*abb"))
+            test_dfa = cache.get_or_build(key, "dfa", lambda: DFA(nfa=test_nfa))
+            cached_nfa = cache.get(key, "nfa")
+            cached_dfa = cache.get_or_build(key, "dfa", lambda: self.fail("rebuilt"))
+            self.assertIsInstance(cached_nfa, NFA)
+            self.assertIsInstance(cached_dfa, DFA)
+            self.assertEqual(len(cached_nfa.get_state_list()),
+                             len(test_nfa.get_state_list()))
+            self.assertEqual(str(cached_dfa), str(test_dfa))
+            for s in ("abb", "babb", "ab", "abba"):
+                self.assertEqual(cached_nfa.test(s), test_nfa.test(s))
+                self.assertEqual(cached_dfa.test(s), test_nfa.test(s))
+            self.assertEqual((cache.hits, cache.misses), (2, 3))
+
+            # keys depend on file contents
+            path = os.path.join(tmp_dir, "graph")
+            NFA(regex="ab").write_file(path)
+            first_key = file_key(path)
+            NFA(regex="ba").write_file(path)
+            self.assertNotEqual(file_key(path), first_key)
+            # and on the pipeline version, so entries built differently
+            # by older versions are not used
+            with unittest.mock.patch("cache.PIPELINE_VERSION", 1):
+                old_key = regex_key("ab")
+            self.assertNotEqual(regex_key("ab"), old_key)
+
+            # corrupt entries are misses
+            with open(cache._path(key, "nfa"), "wb") as file:
+                file.write(b"not an automaton")
+            self.assertIsNone(cache.get(key, "nfa"))
+
+            # least recently used entries are evicted first
+            cache.max_bytes = cache.size()
+            os.utime(cache._path(key, "dfa"), ns=(0, 0))
+            cache.put(regex_key("a"), "nfa", NFA(regex="a"))
+            self.assertIsNone(cache.get(key, "dfa"))
+            self.assertIsNotNone(cache.get(regex_key("a"), "nfa"))
+            self.assertLessEqual(cache.size(), cache.max_bytes)
+            cache.clear()
+            self.assertEqual(cache.size(), 0)
+
+    def test_memo(self):
+        print("Testing in-process compilation memo")
+        memo.COMPILED.clear()
+        min_dfa = memo.compile_regex("(a|b)*abb")
+        self.assertIs(memo.compile_regex("(a|b)*abb"), min_dfa)
+        self.assertIs(memo.compile_regex("(a|b)*abb", "nfa"),
+                      memo.compile_regex("(a|b)*abb", "nfa"))
+        info = memo.COMPILED.info()
+        self.assertEqual((info["hits"], info["misses"]), (3, 4))
+        for s in ("abb", "babb", "ab", "abba"):
+            self.assertEqual(min_dfa.test(s), NFA(regex="(a|b)*abb").test(s))
+
+        # shared automata are frozen; copies are not
+        self.assertTrue(min_dfa.frozen)
+        with self.assertRaises(FSA_Error):
+            min_dfa.label_states()
+        copy = min_dfa.copy()
+        copy.label_states(10)
+        self.assertEqual(str(min_dfa), str(memo.compile_regex("(a|b)*abb")))
+        nfa = memo.compile_regex("ab*", "nfa")
+        self.assertEqual(nfa.to_regex(), NFA(regex="ab*").to_regex())
+        with self.assertRaises(FSA_Error):
+            nfa.merge_lambda_states()
+        before = str(nfa)
+        joined = NFA()
+        joined.concatenate(nfa, nfa)
+        starred = NFA()
+        starred.star(nfa)
+        self.assertEqual(str(nfa), before)
+        self.assertTrue(joined.test("abab") and starred.test("abbab"))
+        # parse trees are copied, since condense modifies them
+        tree = memo.compile_regex("(aa*)*", "parse")
+        self.assertEqual(repr(condense(tree)), "(* (+ a))")
+        self.assertEqual(repr(memo.compile_regex("(aa*)*", "parse")),
+                         repr(parse("(aa*)*")))
+
+        # least recently used entries are discarded
+        memo.COMPILED.max_size = 2
+        memo.compile_regex("a", "parse")
+        self.assertEqual(len(memo.COMPILED), 2)
+        memo.COMPILED.max_size = memo.DEFAULT_MAX_SIZE
+        with self.assertRaises(ValueError):
+            memo.compile_regex("a", "bytecode")
+
+    def test_cli(self):
+        print("Testing command line interface")
+        def run(*argv):
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output):
+                status = cli.main(list(argv))
+            return status, [json.loads(line) for line in output.getvalue().splitlines()]
+
+        status, results = run("load", "regex", "(a|b)*abb", "dfa", "reduce",
+                              "test", "babb", "test", "-b", "abb")
+        self.assertEqual(status, cli.EXIT_OK)
+        self.assertEqual([r["command"] for r in results],
+                         ["load", "dfa", "reduce", "test", "test"])
+        self.assertEqual(results[2]["type"], "DFA")
+        self.assertTrue(all(r["accepted"] for r in results[3:]))
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            graph = os.path.join(tmp_dir, "graph")
+            script = os.path.join(tmp_dir, "script")
+            with open(script, "w") as file:
+                file.write(f"load regex 'a*b'\nwrite {graph}  # save it\n"
+                           f"load file {graph}\ntest ab\ntest ba\n")
+            status, results = run("--script", script)
+            self.assertEqual(status, cli.EXIT_REJECTED)
+            self.assertEqual([r.get("accepted") for r in results[3:]], [True, False])
+
+            # errors outside the file format checks are reported too
+            with open(script, "w") as file:
+                file.write("load regex 'a*b\n")
+            status, results = run("--script", script)
+            self.assertEqual(status, cli.EXIT_ERROR)
+            self.assertIn("ValueError", results[-1]["error"])
+            with open(graph, "w") as file:
+                file.write("@0\n!\na: 1\n")
+            status, results = run("load", "file", graph, "test", "a")
+            self.assertEqual(status, cli.EXIT_ERROR)
+            self.assertEqual(results[-1]["command"], "load")
+
+        # a converted automaton can be written and loaded again
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            graph = os.path.join(tmp_dir, "graph")
+            jflap = os.path.join(tmp_dir, "graph.jff")
+            status, results = run("load", "regex", "(a|b)*abb", "dfa", "write", graph,
+                                  "export", jflap, "load", "file", graph, "test", "abb",
+                                  "load", "jflap", jflap, "test", "babb")
+            self.assertEqual(status, cli.EXIT_OK)
+            self.assertEqual(results[4]["type"], "DFA")
+
+        status, results = run("test", "a")
+        self.assertEqual(status, cli.EXIT_ERROR)
+        self.assertEqual(results[-1]["command"], "test")
+        status, results = run("load", "regex")
+        self.assertEqual(status, cli.EXIT_ERROR)
+
     def test_is_dfa(self):
         print("Testing dfa identification")
         tg = Transition_Graph(jflap="testing/wb_cases/is_dfa_yes.jff")